@@ -0,0 +1,112 @@
+"""
+Benchmark the server-side work of the /symbol_spread/aligned endpoint at a given size.
+
+Synthetic ticks are written as the CSV which the endpoint's COPY returns, then every request
+parses them, aligns them on the grid and encodes the result as json or npz. Requests are
+repeated several times to report p50/p99 latency per format. Time spent by postgres to produce
+the rows is not included, the load test's aligned_json and aligned_npz routes measure the
+endpoint end to end.
+
+Usage: python benchmarks/aligned_resampling.py --symbols 50 --seconds 86400 --step 1
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from resampling import align_symbols, build_time_grid, encode_aligned_npz, \
+    matrix_to_json_columns, read_ticks_csv, rolling_correlation  # noqa: E402
+
+
+def generate_ticks_dataframe(number_of_symbols, seconds, ticks_per_second, seed):
+    """
+    Generate ticks at random times with a random walk mid price per symbol
+
+    :rtype: pd.DataFrame
+    :return: Ticks sorted by symbol and unix_timestamp, as returned by the endpoint's query
+    """
+    rng = np.random.default_rng(seed)
+    ticks_per_symbol = int(seconds * ticks_per_second)
+    symbol_dfs = []
+    for symbol_id in range(number_of_symbols):
+        timestamps = np.sort(rng.uniform(0, seconds, ticks_per_symbol))
+        mids = rng.uniform(1, 5000) * np.exp(np.cumsum(rng.normal(0, 1e-4, ticks_per_symbol)))
+        half_spreads = mids * rng.uniform(1e-5, 5e-4, ticks_per_symbol)
+        symbol_dfs.append(pd.DataFrame({
+            "symbol": f"SYM{symbol_id}/USD", "unix_timestamp": timestamps,
+            "bid": mids - half_spreads, "ask": mids + half_spreads,
+        }))
+    return pd.concat(symbol_dfs, ignore_index=True)
+
+
+def run_aligned_request(ticks_csv, symbols, seconds, step, ffill_limit, corr_window,
+                        response_format):
+    ticks_df = read_ticks_csv(io.BytesIO(ticks_csv))
+    grid = build_time_grid(0, seconds - step, step)
+    matrices = align_symbols(ticks_df, symbols, grid, step, ffill_limit)
+    if corr_window is not None:
+        matrices["correlation"] = rolling_correlation(matrices["mid"], corr_window)
+
+    if response_format == "npz":
+        return encode_aligned_npz(grid, symbols, matrices)
+    # flask serializes the returned dict with json.dumps
+    return json.dumps({"count": len(grid), "symbols": symbols, "timestamps": grid.tolist(),
+                       **{field: matrix_to_json_columns(matrix, symbols)
+                          for field, matrix in matrices.items()}}).encode()
+
+
+def percentile(values, percent):
+    return round(float(np.percentile(values, percent)), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--seconds", type=int, default=86400)
+    parser.add_argument("--step", type=float, default=1)
+    parser.add_argument("--ticks-per-second", type=float, default=1,
+                        help="Average number of ticks per second of every symbol")
+    parser.add_argument("--ffill-limit", type=int, default=5)
+    parser.add_argument("--corr-window", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="File to write the json results to")
+    args = parser.parse_args()
+
+    ticks_df = generate_ticks_dataframe(args.symbols, args.seconds, args.ticks_per_second,
+                                        args.seed)
+    ticks_csv = ticks_df.to_csv(index=False).encode()
+    symbols = [f"SYM{symbol_id}/USD" for symbol_id in range(args.symbols)]
+
+    results = {"symbols": args.symbols, "seconds": args.seconds, "step": args.step,
+               "ticks": len(ticks_df), "cells": int(args.seconds / args.step) * args.symbols,
+               "formats": {}}
+    for response_format in ["npz", "json"]:
+        latencies_ms, response_bytes = [], 0
+        for _ in range(args.repeat):
+            start_time = time.perf_counter()
+            response_bytes = len(run_aligned_request(
+                ticks_csv, symbols, args.seconds, args.step, args.ffill_limit, args.corr_window,
+                response_format
+            ))
+            latencies_ms.append((time.perf_counter() - start_time) * 1000)
+        results["formats"][response_format] = {
+            "p50_ms": percentile(latencies_ms, 50), "p99_ms": percentile(latencies_ms, 99),
+            "response_bytes": response_bytes,
+        }
+
+    print(json.dumps(results, indent=2))
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
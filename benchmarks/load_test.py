@@ -0,0 +1,361 @@
+"""
+Query-side load tests for the symbol_spread routes of the flask application.
+
+generate: bulk load synthetic ticks for N symbols and M rows into postgres with COPY
+run: drive the routes with a weighted mix of concurrent requests and write throughput, latency
+    percentiles, database vs serialization time and peak server memory to json
+compare: compare two result files and report latency regressions
+
+Database vs serialization time and memory are read from the Server-Timing and X-RSS-KB headers,
+which the application only sends when started with ENABLE_SERVER_TIMING=1. The peak memory of a
+run is the largest resident memory reported by its responses, next to the resident memory before
+the run. Latency percentiles only include successful requests, failed requests are counted in
+errors.
+
+Usage:
+    python benchmarks/load_test.py generate --symbols 20 --rows 5000000
+    python benchmarks/load_test.py run --base-url http://127.0.0.1 --concurrency 16 \\
+        --requests 5000 --output results.json
+    python benchmarks/load_test.py compare baseline.json results.json
+"""
+import argparse
+import http.client
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from constants import SYMBOL_SPREAD_TABLE_FIELDS, SYMBOL_SPREAD_TABLE_NAME, \
+    SYMBOL_LATEST_TABLE_NAME, RETENTION_WATERMARK_TABLE_NAME  # noqa: E402
+from db_utils import get_upsert_symbol_latest_sql  # noqa: E402
+
+GENERATE_CHUNK_ROWS = 100000
+
+# Relative weights of the routes in the request mix. Fetching the whole table and the aligned
+# routes are excluded by default as a single request returns a large part of the table
+DEFAULT_ROUTE_MIX = "all=0,symbol=1,bid_latest=10,ask_latest=10,bid_timestamp=10," \
+                    "ask_timestamp=10,id=10,latest=10,aligned_json=0,aligned_npz=0"
+ROUTES = ["all", "symbol", "bid_latest", "ask_latest", "bid_timestamp", "ask_timestamp", "id",
+          "latest", "aligned_json", "aligned_npz"]
+
+
+def get_symbol_name(symbol_id):
+    return f"SYM{symbol_id}/USD"
+
+
+def generate_tick_rows(number_of_symbols, number_of_rows, end_timestamp, tick_interval, seed):
+    """
+    Generate ticks as a random walk of the mid price per symbol with a random spread and sizes.
+    Symbols tick in turn every tick_interval seconds, ending at end_timestamp.
+
+    :rtype: Iterator[tuple]
+    :return: Rows with the columns in SYMBOL_SPREAD_TABLE_FIELDS
+    """
+    rng = random.Random(seed)
+    mids = [rng.uniform(1, 5000) for _ in range(number_of_symbols)]
+    start_timestamp = end_timestamp - number_of_rows * tick_interval
+    for row_id in range(number_of_rows):
+        symbol_id = row_id % number_of_symbols
+        mid = mids[symbol_id] * (1 + rng.gauss(0, 1e-4))
+        mids[symbol_id] = mid
+        half_spread = mid * rng.uniform(1e-5, 5e-4)
+        unix_timestamp = start_timestamp + row_id * tick_interval
+        bid, ask = round(mid - half_spread, 6), round(mid + half_spread, 6)
+        yield (bid, ask, round(rng.uniform(0.01, 50), 4), round(rng.uniform(0.01, 50), 4),
+               bid if rng.random() < 0.5 else ask, unix_timestamp, get_symbol_name(symbol_id),
+               datetime.utcfromtimestamp(unix_timestamp).strftime("%Y/%m/%d %H:%M:%S.%f"))
+
+
+def generate(args):
+    """Bulk load synthetic ticks with COPY, in chunks to keep memory bounded"""
+    connection = psycopg2.connect(args.dsn)
+    cursor = connection.cursor()
+    if args.truncate:
+        cursor.execute(f"TRUNCATE {SYMBOL_SPREAD_TABLE_NAME}, {SYMBOL_LATEST_TABLE_NAME}, "
+                       f"{RETENTION_WATERMARK_TABLE_NAME} RESTART IDENTITY")
+
+    copy_sql = f"COPY {SYMBOL_SPREAD_TABLE_NAME} ({','.join(SYMBOL_SPREAD_TABLE_FIELDS)}) " \
+               f"FROM STDIN WITH (FORMAT csv)"
+    start_time = time.perf_counter()
+    buffer = io.StringIO()
+    rows_in_buffer, rows_written = 0, 0
+    rows = generate_tick_rows(args.symbols, args.rows, args.end_timestamp or time.time(),
+                              args.tick_interval, args.seed)
+    for row in rows:
+        buffer.write(",".join(repr(value) if isinstance(value, float) else str(value)
+                              for value in row))
+        buffer.write("\n")
+        rows_in_buffer += 1
+        if rows_in_buffer == GENERATE_CHUNK_ROWS:
+            buffer.seek(0)
+            cursor.copy_expert(copy_sql, buffer)
+            rows_written += rows_in_buffer
+            print(f"Loaded {rows_written}/{args.rows} rows")
+            buffer, rows_in_buffer = io.StringIO(), 0
+    if rows_in_buffer:
+        buffer.seek(0)
+        cursor.copy_expert(copy_sql, buffer)
+        rows_written += rows_in_buffer
+    cursor.execute(get_upsert_symbol_latest_sql(SYMBOL_SPREAD_TABLE_NAME))
+
+    connection.commit()
+    connection.autocommit = True
+    cursor.execute(f"ANALYZE {SYMBOL_SPREAD_TABLE_NAME}")
+    print(f"Loaded {rows_written} rows for {args.symbols} symbols in "
+          f"{time.perf_counter() - start_time:.1f}s")
+
+
+def get_dataset_bounds(dsn):
+    """
+    Look up the symbols, timestamp range and id range to build requests from
+
+    :rtype: dict
+    """
+    connection = psycopg2.connect(dsn)
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT DISTINCT symbol FROM {SYMBOL_SPREAD_TABLE_NAME}")
+    symbols = [row[0] for row in cursor.fetchall()]
+    cursor.execute(f"SELECT min(unix_timestamp), max(unix_timestamp), min(id), max(id), count(*) "
+                   f"FROM {SYMBOL_SPREAD_TABLE_NAME}")
+    min_timestamp, max_timestamp, min_id, max_id, number_of_rows = cursor.fetchone()
+    connection.close()
+    return {"symbols": symbols, "min_timestamp": min_timestamp, "max_timestamp": max_timestamp,
+            "min_id": min_id, "max_id": max_id, "rows": number_of_rows}
+
+
+def build_request_path(route, bounds, rng, aligned_symbols, aligned_seconds):
+    symbol = urllib.parse.quote(rng.choice(bounds["symbols"]))
+    timestamp = rng.uniform(bounds["min_timestamp"], bounds["max_timestamp"])
+    if route in {"aligned_json", "aligned_npz"}:
+        # The most recent aligned_seconds of the first aligned_symbols symbols at 1s resolution
+        symbols = urllib.parse.quote(",".join(sorted(bounds["symbols"])[:aligned_symbols]))
+        end_timestamp = bounds["max_timestamp"]
+        return f"/symbol_spread/aligned?symbols={symbols}&start={end_timestamp - aligned_seconds}" \
+               f"&end={end_timestamp}&step=1&ffill_limit=5&format={route.split('_')[1]}"
+    if route == "all":
+        return "/symbol_spread"
+    if route == "latest":
+        return "/symbol_spread/latest"
+    if route == "symbol":
+        return f"/symbol_spread/{symbol}/"
+    if route in {"bid_latest", "ask_latest"}:
+        return f"/symbol_spread/{symbol}/{route.split('_')[0]}"
+    if route in {"bid_timestamp", "ask_timestamp"}:
+        return f"/symbol_spread/{symbol}/{route.split('_')[0]}?timestamp={timestamp}"
+    return f"/symbol_spread/{rng.randint(bounds['min_id'], bounds['max_id'])}/"
+
+
+def parse_server_timing(header):
+    """
+    :param str header: Server-Timing header, e.g. "db;dur=1.2, app;dur=3.4, total;dur=4.6"
+    :rtype: dict[str, float]
+    :return: Duration in milliseconds per metric name
+    """
+    timings = {}
+    for metric in (header or "").split(","):
+        name, _, duration = metric.strip().partition(";dur=")
+        if duration:
+            timings[name] = float(duration)
+    return timings
+
+
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1))))
+    return round(sorted_values[index], 3)
+
+
+def summarize_samples(samples, duration):
+    # Timeouts and fast error responses would distort the percentiles, they are only counted
+    successful_samples = [sample for sample in samples if 0 < sample["status"] < 400]
+    latencies = sorted(sample["latency_ms"] for sample in successful_samples)
+    db_times = [sample["db_ms"] for sample in successful_samples if sample["db_ms"] is not None]
+    app_times = [sample["app_ms"] for sample in successful_samples if sample["app_ms"] is not None]
+    return {
+        "requests": len(samples),
+        "errors": len(samples) - len(successful_samples),
+        "throughput_rps": round(len(samples) / duration, 2) if duration else None,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "mean_db_ms": round(sum(db_times) / len(db_times), 3) if db_times else None,
+        "mean_serialization_ms": round(sum(app_times) / len(app_times), 3) if app_times else None,
+        "mean_response_bytes": round(sum(sample["bytes"] for sample in successful_samples)
+                                     / len(successful_samples)) if successful_samples else None,
+    }
+
+
+def fetch_server_rss_kb(base_url, timeout):
+    """
+    Read the resident memory of the application from the X-RSS-KB header of a cheap request
+
+    :rtype: int | None
+    :return: Resident memory in kB, None if the application does not report it
+    """
+    try:
+        with urllib.request.urlopen(base_url.rstrip("/") + "/symbol_spread/latest",
+                                    timeout=timeout) as response:
+            rss_kb = response.headers.get("X-RSS-KB")
+    except (urllib.error.URLError, http.client.HTTPException, OSError) as e:
+        print(f"Cannot read the server memory: {e}")
+        return None
+    return int(rss_kb) if rss_kb is not None else None
+
+
+def run(args):
+    """Drive the routes with concurrent requests and write the results to json"""
+    route_weights = {}
+    for route_weight in args.mix.split(","):
+        route, _, weight = route_weight.partition("=")
+        if route not in ROUTES:
+            raise ValueError(f"Unknown route {route}. Expected one of {ROUTES}")
+        route_weights[route] = float(weight)
+    routes = [route for route in route_weights if route_weights[route] > 0]
+    weights = [route_weights[route] for route in routes]
+
+    bounds = get_dataset_bounds(args.dsn)
+    rng = random.Random(args.seed)
+    planned_requests = [(route, build_request_path(route, bounds, rng, args.aligned_symbols,
+                                                    args.aligned_seconds))
+                        for route in rng.choices(routes, weights=weights, k=args.requests)]
+
+    samples_lock = threading.Lock()
+    samples = {route: [] for route in routes}
+    peak_rss_kb = 0
+
+    def send_request(planned_request):
+        nonlocal peak_rss_kb
+        route, path = planned_request
+        start_time = time.perf_counter()
+        try:
+            with urllib.request.urlopen(args.base_url.rstrip("/") + path,
+                                        timeout=args.timeout) as response:
+                body = response.read()
+                status, headers = response.status, response.headers
+        except urllib.error.HTTPError as e:
+            body, status, headers = e.read(), e.code, e.headers
+        except (urllib.error.URLError, http.client.HTTPException, OSError) as e:
+            # Connection errors, resets and timeouts are recorded as failed requests with status 0
+            # instead of aborting the run
+            print(f"{route} request {path} failed: {e}")
+            body, status, headers = b"", 0, {}
+        latency_ms = (time.perf_counter() - start_time) * 1000
+
+        timings = parse_server_timing(headers.get("Server-Timing"))
+        sample = {"latency_ms": latency_ms, "status": status, "bytes": len(body),
+                  "db_ms": timings.get("db"), "app_ms": timings.get("app")}
+        with samples_lock:
+            samples[route].append(sample)
+            peak_rss_kb = max(peak_rss_kb, int(headers.get("X-RSS-KB", 0)))
+
+    rss_before_kb = fetch_server_rss_kb(args.base_url, args.timeout)
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(send_request, planned_requests))
+    duration = time.perf_counter() - start_time
+
+    results = {
+        "config": {"base_url": args.base_url, "concurrency": args.concurrency,
+                   "requests": args.requests, "mix": route_weights, "seed": args.seed},
+        "dataset": {"rows": bounds["rows"], "symbols": len(bounds["symbols"])},
+        "duration_seconds": round(duration, 3),
+        "throughput_rps": round(args.requests / duration, 2),
+        "server_rss_before_kb": rss_before_kb,
+        "server_peak_rss_kb": peak_rss_kb or None,
+        "routes": {route: summarize_samples(route_samples, duration)
+                   for route, route_samples in samples.items()},
+    }
+    print(json.dumps(results, indent=2))
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+def compare(args):
+    """Report routes whose latency percentiles regressed by more than the threshold"""
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.current) as file:
+        current = json.load(file)
+
+    regressions = []
+    for route, current_summary in current["routes"].items():
+        baseline_summary = baseline["routes"].get(route)
+        if baseline_summary is None:
+            continue
+        for metric in ["p50_ms", "p95_ms", "p99_ms"]:
+            baseline_value, current_value = baseline_summary[metric], current_summary[metric]
+            if not baseline_value or current_value is None:
+                continue
+            change = current_value / baseline_value - 1
+            print(f"{route:>14} {metric}: {baseline_value:>10.3f} -> {current_value:>10.3f} "
+                  f"({change:+.1%})")
+            if change > args.threshold:
+                regressions.append(f"{route} {metric}")
+
+    if regressions:
+        print(f"Regressions above {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load tests for the symbol_spread routes")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    default_dsn = "dbname=postgres user=postgres password=postgres host=localhost port=5432"
+
+    generate_parser = subparsers.add_parser("generate", help="Bulk load synthetic ticks")
+    generate_parser.add_argument("--dsn", default=default_dsn)
+    generate_parser.add_argument("--symbols", type=int, default=20)
+    generate_parser.add_argument("--rows", type=int, default=1000000)
+    generate_parser.add_argument("--tick-interval", type=float, default=0.05,
+                                 help="Seconds between two generated ticks")
+    generate_parser.add_argument("--end-timestamp", type=float, default=None,
+                                 help="Timestamp of the last tick, defaults to now")
+    generate_parser.add_argument("--seed", type=int, default=0)
+    generate_parser.add_argument("--truncate", action="store_true",
+                                 help="Empty the table before loading")
+    generate_parser.set_defaults(function=generate)
+
+    run_parser = subparsers.add_parser("run", help="Drive the routes with concurrent requests")
+    run_parser.add_argument("--dsn", default=default_dsn)
+    run_parser.add_argument("--base-url", default="http://127.0.0.1")
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--requests", type=int, default=1000)
+    run_parser.add_argument("--mix", default=DEFAULT_ROUTE_MIX,
+                            help=f"Route weights, routes: {', '.join(ROUTES)}")
+    run_parser.add_argument("--aligned-symbols", type=int, default=50,
+                            help="Number of symbols requested by the aligned routes")
+    run_parser.add_argument("--aligned-seconds", type=float, default=4000,
+                            help="Time range in seconds requested by the aligned routes, the "
+                                 "default keeps 50 symbols within the json grid cap")
+    run_parser.add_argument("--timeout", type=float, default=60)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--output", default=None, help="File to write the json results to")
+    run_parser.set_defaults(function=run)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="Relative latency increase reported as a regression")
+    compare_parser.set_defaults(function=compare)
+
+    args = parser.parse_args()
+    args.function(args)
+
+
+if __name__ == "__main__":
+    main()
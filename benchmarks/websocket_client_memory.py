@@ -0,0 +1,125 @@
+"""
+Benchmark memory per market and per-call latency of the FtxWebsocketClient buffers.
+
+Synthetic trades and tickers are fed through the client's message handler without connecting to
+FTX. Memory is measured with tracemalloc against a baseline which stores the raw decoded dicts in
+deques, as the client did before using slotted records.
+
+Usage: python benchmarks/websocket_client_memory.py --markets 200 --trades-per-market 10000
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+from collections import defaultdict, deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from websocket_ftx.client import FtxWebsocketClient  # noqa: E402
+
+
+def make_trade_message(market, trade_id):
+    return json.dumps({
+        "channel": "trades", "market": market, "type": "update",
+        "data": [{"id": trade_id, "price": 3000.5 + trade_id % 100, "size": 0.01,
+                  "side": "buy", "liquidation": False, "time": "2022-04-03T14:25:59.123456+00:00"}]
+    })
+
+
+def make_ticker_message(market, tick_id):
+    return json.dumps({
+        "channel": "ticker", "market": market, "type": "update",
+        "data": {"bid": 3000.5, "ask": 3000.6, "bidSize": 1.2, "askSize": 3.4,
+                 "last": 3000.5, "time": 1648995959.0 + tick_id}
+    })
+
+
+def measure_memory(store_messages, messages):
+    tracemalloc.start()
+    snapshot_before = tracemalloc.take_snapshot()
+    store = store_messages(messages)
+    snapshot_after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated_bytes = sum(stat.size_diff for stat in
+                          snapshot_after.compare_to(snapshot_before, "filename"))
+    return store, allocated_bytes
+
+
+def store_in_dict_deques(messages):
+    trades = defaultdict(lambda: deque([], maxlen=10000))
+    tickers = defaultdict(dict)
+    for raw_message in messages:
+        message = json.loads(raw_message)
+        if message["channel"] == "trades":
+            trades[message["market"]].append(message["data"])
+        else:
+            tickers[message["market"]] = message["data"]
+    return trades, tickers
+
+
+def store_in_client(messages):
+    client = FtxWebsocketClient(api_key="", api_secret="")
+    for raw_message in messages:
+        client._on_message(None, raw_message)
+    return client
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--markets", type=int, default=200)
+    parser.add_argument("--trades-per-market", type=int, default=10000)
+    parser.add_argument("--new-trades-per-read", type=int, default=10)
+    parser.add_argument("--output", default=None, help="File to write the json results to")
+    args = parser.parse_args()
+
+    markets = [f"COIN{market_id}/USD" for market_id in range(args.markets)]
+    messages = [make_ticker_message(market, 0) for market in markets]
+    messages += [make_trade_message(market, trade_id)
+                 for market in markets for trade_id in range(args.trades_per_market)]
+
+    _, baseline_bytes = measure_memory(store_in_dict_deques, messages)
+    client, client_bytes = measure_memory(store_in_client, messages)
+
+    # Subscriptions are registered directly so the readers do not try to connect
+    market = markets[0]
+    client._subscriptions.append({"channel": "trades", "market": market})
+    client._subscriptions.append({"channel": "ticker", "market": market})
+    _, cursor = client.get_trades_since(market)
+    new_trade_messages = [make_trade_message(market, trade_id)
+                          for trade_id in range(args.new_trades_per_read)]
+
+    def read_new_trades():
+        nonlocal cursor
+        for raw_message in new_trade_messages:
+            client._on_message(None, raw_message)
+        _, cursor = client.get_trades_since(market, cursor)
+
+    def read_all_trades():
+        for raw_message in new_trade_messages:
+            client._on_message(None, raw_message)
+        client.get_trades(market)
+
+    number_of_calls = 100
+    results = {
+        "markets": args.markets,
+        "trades_per_market": args.trades_per_market,
+        "baseline_bytes_per_market": round(baseline_bytes / args.markets),
+        "records_bytes_per_market": round(client_bytes / args.markets),
+        "get_trades_us_per_call": round(
+            timeit.timeit(read_all_trades, number=number_of_calls) / number_of_calls * 1e6, 1),
+        "get_trades_since_us_per_call": round(
+            timeit.timeit(read_new_trades, number=number_of_calls) / number_of_calls * 1e6, 1),
+        "get_ticker_us_per_call": round(
+            timeit.timeit(lambda: client.get_ticker(market), number=10000) / 10000 * 1e6, 3),
+    }
+
+    print(json.dumps(results, indent=2))
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,29 @@
+import io
+import math
 import os
+import time
 
 import numpy as np
-from flask import request, Flask
+from flask import request, Flask, Response
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column, Float, Integer, String
+from sqlalchemy import Column, Float, Index, Integer, String
 
-from constants import SYMBOL_SPREAD_TABLE_FIELDS, SYMBOL_SPREAD_TABLE_NAME
-from db_utils import reset_database
+from constants import SYMBOL_SPREAD_TABLE_FIELDS, SYMBOL_SPREAD_TABLE_NAME, \
+    SYMBOL_LATEST_TABLE_NAME, ALIGNED_MAX_GRID_CELLS, RETENTION_WATERMARK_TABLE_NAME
+from db_utils import refresh_symbol_latest_entry, reset_database
+from export import EXPORT_COMPRESSIONS, EXPORT_FORMATS, EXPORT_MIMETYPES, export_symbol_spread
+from resampling import build_time_grid, align_symbols, rolling_correlation, \
+    matrix_to_json_columns, encode_aligned_npz, read_ticks_csv
+from retention import bulk_delete_symbol_range
+from server_timing import init_server_timing
 
 app = Flask(__name__)
 
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
 db = SQLAlchemy(app)
 
-# Create a fresh database
-reset_database(db, populate_csv_initial_data=True)
+if os.environ.get('ENABLE_SERVER_TIMING'):
+    init_server_timing(app, db.engine)
 
 
 class SymbolSpreadModel(db.Model):
@@ -22,6 +31,9 @@ class SymbolSpreadModel(db.Model):
     Defines the symbol_spread model
     """
     __tablename__ = SYMBOL_SPREAD_TABLE_NAME
+    __table_args__ = (
+        Index(f"ix_{SYMBOL_SPREAD_TABLE_NAME}_symbol_unix_timestamp", "symbol", "unix_timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     bid = Column(Float, nullable=True)
@@ -66,6 +78,50 @@ class SymbolSpreadModel(db.Model):
                 "unix_timestamp": self.unix_timestamp}
 
 
+class SymbolLatestModel(db.Model):
+    """
+    Defines the symbol_latest model, holding the most recent symbol_spread entry of every symbol.
+    Rows are upserted by the streaming script in the same statement as the symbol_spread insert.
+    """
+    __tablename__ = SYMBOL_LATEST_TABLE_NAME
+
+    symbol = Column(String, primary_key=True)
+    bid = Column(Float, nullable=True)
+    ask = Column(Float, nullable=True)
+    bid_size = Column(Float, nullable=True)
+    ask_size = Column(Float, nullable=True)
+    last = Column(Float, nullable=True)
+    unix_timestamp = Column(Float, nullable=True)
+    datetime = Column(String, nullable=True)
+
+    def to_json(self):
+        """
+        Return item in json format
+
+        :rtype: dict
+        :return: json serialized SymbolLatestModel object
+        """
+        return {"symbol": self.symbol, "bid": self.bid, "ask": self.ask,
+                "unix_timestamp": self.unix_timestamp}
+
+
+class RetentionWatermarkModel(db.Model):
+    """
+    Defines the retention_watermark model, holding the timestamp up to which the retention job
+    already downsampled every symbol. Declared here so that resetting the database clears it
+    together with the entries it refers to.
+    """
+    __tablename__ = RETENTION_WATERMARK_TABLE_NAME
+
+    symbol = Column(String, primary_key=True)
+    downsample_interval = Column(Float, nullable=False)
+    downsampled_until = Column(Float, nullable=False)
+
+
+# Create a fresh database
+reset_database(db, populate_csv_initial_data=True)
+
+
 def get_closest_timestamp_entry(query_timestamp, symbol=None):
     if symbol is None:
         results = SymbolSpreadModel.query.all()
@@ -128,6 +184,177 @@ def get_all_items():
         return {"message": "Failed to fetch all items"}, 404
 
 
+def get_aligned_ticks_dataframe(symbols, start_timestamp, end_timestamp):
+    """
+    Fetch the bid and ask of the given symbols between two timestamps, together with the last
+    entry of every symbol before start_timestamp so that the first grid timestamps have an as-of
+    value. Rows are streamed with COPY as CSV and parsed into arrays in bulk, instead of fetching
+    one Python tuple per row through the cursor.
+
+    :param list[str] symbols: Symbols to fetch entries for
+    :param float start_timestamp: Start of the time range
+    :param float end_timestamp: End of the time range (inclusive)
+    :rtype: pd.DataFrame
+    :return: Entries sorted by symbol and unix_timestamp
+    """
+    sql = f"SELECT previous.symbol, previous.unix_timestamp, previous.bid, previous.ask " \
+          f"FROM unnest(%(symbols)s::varchar[]) AS requested(symbol) CROSS JOIN LATERAL (" \
+          f"SELECT symbol, unix_timestamp, bid, ask FROM {SYMBOL_SPREAD_TABLE_NAME} " \
+          f"WHERE symbol = requested.symbol AND unix_timestamp < %(start_timestamp)s " \
+          f"ORDER BY unix_timestamp DESC LIMIT 1) AS previous " \
+          f"UNION ALL " \
+          f"SELECT symbol, unix_timestamp, bid, ask FROM {SYMBOL_SPREAD_TABLE_NAME} " \
+          f"WHERE symbol = ANY(%(symbols)s) AND unix_timestamp >= %(start_timestamp)s " \
+          f"AND unix_timestamp <= %(end_timestamp)s " \
+          f"ORDER BY symbol, unix_timestamp"
+    params = {"symbols": symbols, "start_timestamp": start_timestamp,
+              "end_timestamp": end_timestamp}
+
+    csv_buffer = io.BytesIO()
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        # COPY does not take bind parameters, so they are rendered into the query first
+        query = cursor.mogrify(sql, params).decode()
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", csv_buffer)
+        cursor.close()
+        connection.rollback()
+    finally:
+        connection.close()
+
+    csv_buffer.seek(0)
+    return read_ticks_csv(csv_buffer)
+
+
+@app.route('/symbol_spread/latest', methods=['GET'])
+def get_latest_items():
+    """
+    Fetch the most recent entry of every symbol from the symbol_latest table, which holds one row
+    per symbol so the cost does not depend on the size of the symbol_spread history
+
+    Request: 127.0.0.1/symbol_spread/latest
+    """
+    try:
+        symbol_latest_results = SymbolLatestModel.query.order_by(SymbolLatestModel.symbol).all()
+        results = [get_json_from_object(symbol_latest_entry, SYMBOL_SPREAD_TABLE_FIELDS)
+                   for symbol_latest_entry in symbol_latest_results]
+
+        return {"count": len(results), "symbol_latest_entries": results}
+    except Exception as e:
+        print(e)
+        return {"message": "Failed to fetch latest items"}, 404
+
+
+@app.route('/symbol_spread/aligned', methods=['GET'])
+def get_aligned_items():
+    """
+    Fetch the as-of mid, bid and ask prices of several symbols on a common time grid. Grid
+    timestamps where a symbol has no entry within ffill_limit steps are null. If corr_window is
+    given, the rolling correlation of every symbol's mid price returns with the first symbol over
+    corr_window steps is added. With format=npz, a binary numpy archive is returned instead of
+    json.
+
+    Request: 127.0.0.1/symbol_spread/aligned?symbols=ETH/USD,SOL/USD&start=1648995000&end=1648995959
+    Request: 127.0.0.1/symbol_spread/aligned?symbols=ETH/USD,SOL/USD&start=1648995000&end=1648995959
+        &step=1&ffill_limit=5&corr_window=60&format=npz
+    """
+    try:
+        query_dict = request.args.to_dict()
+        symbols = [symbol for symbol in query_dict.get("symbols", "").split(",") if symbol]
+        start_timestamp = float(query_dict["start"])
+        end_timestamp = float(query_dict["end"])
+        step = float(query_dict.get("step", 1))
+        ffill_limit = int(query_dict["ffill_limit"]) if "ffill_limit" in query_dict else None
+        corr_window = int(query_dict["corr_window"]) if "corr_window" in query_dict else None
+        response_format = query_dict.get("format", "json")
+    except (KeyError, ValueError) as e:
+        print(e)
+        return {"message": "Expected symbols, start and end query parameters"}, 400
+
+    if not all(math.isfinite(value) for value in (start_timestamp, end_timestamp, step)):
+        return {"message": "Expected finite start, end and step query parameters"}, 400
+    if not symbols or step <= 0 or end_timestamp < start_timestamp:
+        return {"message": "Expected at least one symbol, a positive step and start <= end"}, 400
+    if response_format not in {"json", "npz"}:
+        return {"message": f"Unknown format: {response_format}"}, 400
+    number_of_cells = (int((end_timestamp - start_timestamp) / step) + 1) * len(symbols)
+    max_grid_cells = ALIGNED_MAX_GRID_CELLS[response_format]
+    if number_of_cells > max_grid_cells:
+        return {"message": f"Requested grid has {number_of_cells} cells, the maximum for "
+                           f"{response_format} is {max_grid_cells}. Use format=npz, a larger "
+                           f"step or a shorter range"}, 400
+
+    try:
+        ticks_df = get_aligned_ticks_dataframe(symbols, start_timestamp, end_timestamp)
+
+        grid = build_time_grid(start_timestamp, end_timestamp, step)
+        matrices = align_symbols(ticks_df, symbols, grid, step, ffill_limit)
+        if corr_window is not None:
+            matrices["correlation"] = rolling_correlation(matrices["mid"], corr_window)
+
+        if response_format == "npz":
+            return Response(encode_aligned_npz(grid, symbols, matrices),
+                            mimetype="application/octet-stream")
+
+        return {"count": len(grid), "symbols": symbols, "timestamps": grid.tolist(),
+                **{field: matrix_to_json_columns(matrix, symbols)
+                   for field, matrix in matrices.items()}}
+    except Exception as e:
+        print(e)
+        return {"message": "Failed to get aligned items"}, 404
+
+
+@app.route('/symbol_spread/export', methods=['GET'])
+def export_items():
+    """
+    Stream entries as Arrow IPC, Parquet or CSV. Entries are read in batches from a server-side
+    cursor and encoded one batch at a time, so memory use does not grow with the time range.
+
+    Request: 127.0.0.1/symbol_spread/export?symbol=ETH/USD&start=1648995000&end=1648995959
+    Request: 127.0.0.1/symbol_spread/export?symbol=ETH/USD&format=parquet&compression=zstd
+    """
+    try:
+        query_dict = request.args.to_dict()
+        symbol = query_dict.get("symbol")
+        start_timestamp = float(query_dict["start"]) if "start" in query_dict else None
+        end_timestamp = float(query_dict["end"]) if "end" in query_dict else None
+        export_format = query_dict.get("format", "arrow")
+        compression = query_dict.get("compression")
+    except ValueError as e:
+        print(e)
+        return {"message": "Expected numeric start and end query parameters"}, 400
+
+    if export_format not in EXPORT_FORMATS:
+        return {"message": f"Unknown format: {export_format}. Expected one of "
+                           f"{EXPORT_FORMATS}"}, 400
+    if compression not in EXPORT_COMPRESSIONS[export_format]:
+        allowed_compressions = [c for c in EXPORT_COMPRESSIONS[export_format] if c is not None]
+        return {"message": f"Unknown compression for {export_format}: {compression}. Expected "
+                           f"one of {allowed_compressions} or no compression"}, 400
+
+    try:
+        connection = db.engine.raw_connection()
+        try:
+            exported_chunks = export_symbol_spread(
+                connection, export_format, compression=compression, symbol=symbol,
+                start_timestamp=start_timestamp, end_timestamp=end_timestamp
+            )
+        except Exception:
+            connection.close()
+            raise
+
+        def generate():
+            try:
+                yield from exported_chunks
+            finally:
+                connection.close()
+
+        return Response(generate(), mimetype=EXPORT_MIMETYPES[export_format])
+    except Exception as e:
+        print(e)
+        return {"message": "Failed to export items"}, 404
+
+
 @app.route('/symbol_spread/<path:symbol>/', methods=['GET'])
 def get_items_from_symbol(symbol):
     """
@@ -178,10 +405,11 @@ def get_items_with_query_timestamp_bid(symbol):
                                f" {closest_entry_json}"}
         else:
             # Just get the latest bid
-            latest_symbol_spread_entry = SymbolSpreadModel.query.filter_by(symbol=symbol).\
-                order_by(SymbolSpreadModel.unix_timestamp.desc()).first()
+            latest_symbol_entry = SymbolLatestModel.query.get(symbol)
+            if latest_symbol_entry is None:
+                return {"message": f"Error - Unable to find any entries for {symbol}"}, 404
 
-            latest_bid = latest_symbol_spread_entry.bid
+            latest_bid = latest_symbol_entry.bid
             return {"message": f"Latest {symbol} Bid price: {latest_bid}"}
 
     except Exception as e:
@@ -218,11 +446,12 @@ def get_items_with_query_timestamp_ask(symbol):
             return {"message": f"Closest Ask price: {closest_entry_json['ask']} for entry:"
                                f" {closest_entry_json}"}
         else:
-            # Just get the latest bid
-            latest_symbol_spread_entry = SymbolSpreadModel.query.filter_by(symbol=symbol).\
-                order_by(SymbolSpreadModel.unix_timestamp.desc()).first()
+            # Just get the latest ask
+            latest_symbol_entry = SymbolLatestModel.query.get(symbol)
+            if latest_symbol_entry is None:
+                return {"message": f"Error - Unable to find any entries for {symbol}"}, 404
 
-            latest_ask = latest_symbol_spread_entry.ask
+            latest_ask = latest_symbol_entry.ask
             return {"message": f"Latest {symbol} Ask price: {latest_ask}"}
 
     except Exception as e:
@@ -251,21 +480,72 @@ def get_item_from_id(id):
 @app.route('/symbol_spread/<int:id>/', methods=['DELETE'])
 def delete_item(id):
     """
-    Delete the item with the corresponding id
+    Delete the item with the corresponding id. The symbol_latest row of its symbol is refreshed in
+    the same transaction.
 
     Request: http://127.0.0.1/symbol_spread/2 - with delete
 
     :param int id: ID to find in the table
     """
     try:
-        db.session.query(SymbolSpreadModel).filter_by(id=id).delete()
-        db.session.commit()
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(f"DELETE FROM {SYMBOL_SPREAD_TABLE_NAME} WHERE id = %(id)s "
+                           f"RETURNING symbol", {"id": id})
+            for symbol in {row[0] for row in cursor.fetchall()}:
+                refresh_symbol_latest_entry(cursor, symbol)
+            connection.commit()
+            cursor.close()
+        finally:
+            connection.close()
         return {"Success": f"Item {id} deleted"}
     except Exception as e:
         print(e)
         return {"message": "Failed to delete item"}, 404
 
 
+@app.route('/symbol_spread/<path:symbol>/', methods=['DELETE'])
+def delete_items_from_symbol(symbol):
+    """
+    Delete the items of the given symbol within a time range. Deleting the whole history of the
+    symbol requires all=true. Rows are deleted in bounded batches so that ingestion is not blocked
+    by one large transaction.
+
+    Request: http://127.0.0.1/symbol_spread/ETH/USD/?start=1648995000&end=1648995959 - with delete
+    Request: http://127.0.0.1/symbol_spread/ETH/USD/?all=true - with delete
+
+    :param str symbol: Symbol to delete entries for
+    """
+    try:
+        query_dict = request.args.to_dict()
+        start_timestamp = float(query_dict["start"]) if "start" in query_dict else None
+        end_timestamp = float(query_dict["end"]) if "end" in query_dict else None
+    except ValueError as e:
+        print(e)
+        return {"message": "Expected numeric start and end query parameters"}, 400
+
+    if start_timestamp is None and end_timestamp is None and query_dict.get("all") != "true":
+        return {"message": "Expected a start and/or end query parameter, or all=true to delete "
+                           "every entry of the symbol"}, 400
+
+    try:
+        start_time = time.perf_counter()
+        connection = db.engine.raw_connection()
+        try:
+            deleted_rows = bulk_delete_symbol_range(
+                connection, symbol, start_timestamp=start_timestamp, end_timestamp=end_timestamp
+            )
+        finally:
+            connection.close()
+
+        return {"Success": f"Deleted {deleted_rows} {symbol} items", "deleted_rows": deleted_rows,
+                "runtime_seconds": round(time.perf_counter() - start_time, 3)}
+    except Exception as e:
+        print(e)
+        return {"message": "Failed to delete items from symbol"}, 404
+
+
 if __name__ == "__main__":
     # Create a fresh database
     reset_database(db=db, populate_csv_initial_data=False)
@@ -3,3 +3,33 @@ SYMBOL_SPREAD_TABLE_FIELDS = ['bid', 'ask', 'bid_size', 'ask_size', 'last', 'uni
                               'symbol', 'datetime']
 
 SYMBOL_SPREAD_TABLE_NAME = "symbol_spread"
+
+# Seconds between two log lines of ingestion counters for a symbol
+INGESTION_STATS_LOG_INTERVAL = 60
+# Accepted ticks of all symbols are buffered and written in one statement every flush interval
+# seconds, or as soon as the buffer holds the maximum number of entries
+INGESTION_FLUSH_INTERVAL = 1.0
+INGESTION_FLUSH_MAX_ENTRIES = 500
+
+# Retention job defaults
+RETENTION_DEFAULT_BATCH_SIZE = 5000
+RETENTION_DEFAULT_BATCH_PAUSE = 0.1
+# Number of downsample buckets processed per window, bounding the rows scanned per statement
+RETENTION_DOWNSAMPLE_WINDOW_BUCKETS = 60
+# Seconds between two runs of the retention job
+RETENTION_JOB_INTERVAL = 3600
+# Table holding the timestamp up to which every symbol has already been downsampled
+RETENTION_WATERMARK_TABLE_NAME = "retention_watermark"
+
+# Maximum number of (timestamp, symbol) cells returned by the aligned endpoint per format, keeping
+# the request within a 2s budget with headroom for postgres to produce the rows. Measured with
+# benchmarks/aligned_resampling.py (parsing the COPY output, aligning and encoding), 50 symbols at
+# 1 tick/s: npz over 20000s (1M cells) p50 0.94s / p99 1.07s, json over 4000s (200k cells) p50
+# 0.74s / p99 0.86s. A day at 1s (4.32M cells) takes p50 4.6s as npz and 21s as json, so 50
+# symbols over a day need step=5 or more. Confirm end to end with the load test's aligned routes
+ALIGNED_MAX_GRID_CELLS = {"npz": 1_000_000, "json": 200_000}
+
+# Number of rows read from the server-side cursor and encoded at a time by the export
+EXPORT_BATCH_SIZE = 50000
+
+SYMBOL_LATEST_TABLE_NAME = "symbol_latest"
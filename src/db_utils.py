@@ -1,8 +1,9 @@
 import os
 import pandas as pd
 import psycopg2
+from sqlalchemy import text
 
-from constants import SYMBOL_SPREAD_TABLE_NAME
+from constants import SYMBOL_SPREAD_TABLE_NAME, SYMBOL_SPREAD_TABLE_FIELDS, SYMBOL_LATEST_TABLE_NAME
 
 
 def populate_db_table_with_csv_data(db, table_name,
@@ -18,6 +19,66 @@ def populate_db_table_with_csv_data(db, table_name,
         pass
 
 
+def get_upsert_symbol_latest_sql(source, filter_symbol=False):
+    """
+    Build the statement which upserts the most recent entry per symbol of source into the
+    symbol_latest table. Existing rows are only replaced by entries which are at least as recent.
+
+    :param str source: Table or CTE name with the symbol_spread columns
+    :param bool filter_symbol: Only upsert the entry of the %(symbol)s parameter
+    :rtype: str
+    """
+    fields = ",".join(SYMBOL_SPREAD_TABLE_FIELDS)
+    update_fields = ", ".join(f"{field} = EXCLUDED.{field}" for field in SYMBOL_SPREAD_TABLE_FIELDS
+                              if field != "symbol")
+    where_clause = "WHERE symbol = %(symbol)s " if filter_symbol else ""
+    return f"INSERT INTO {SYMBOL_LATEST_TABLE_NAME} ({fields}) " \
+           f"SELECT DISTINCT ON (symbol) {fields} FROM {source} {where_clause}" \
+           f"ORDER BY symbol, unix_timestamp DESC " \
+           f"ON CONFLICT (symbol) DO UPDATE SET {update_fields} " \
+           f"WHERE {SYMBOL_LATEST_TABLE_NAME}.unix_timestamp IS NULL " \
+           f"OR {SYMBOL_LATEST_TABLE_NAME}.unix_timestamp <= EXCLUDED.unix_timestamp"
+
+
+def refresh_symbol_latest_entry(cursor, symbol, start_timestamp=None, end_timestamp=None):
+    """
+    After entries of a symbol in [start_timestamp, end_timestamp) were deleted, replace its
+    symbol_latest row by the most recent remaining symbol_spread entry if that row was in the
+    deleted range. When it was not, the row is not touched, so ingestion upserting it is not
+    blocked. Nothing is committed, so that the refresh is part of the transaction of the delete.
+
+    :param cursor: DBAPI cursor of the transaction which deleted the entries
+    :param str symbol: Symbol whose entries were deleted
+    :param float start_timestamp: Inclusive lower bound of the deleted range, None for no bound
+    :param float end_timestamp: Exclusive upper bound of the deleted range, None for no bound
+    """
+    conditions = ["symbol = %(symbol)s"]
+    if start_timestamp is not None:
+        conditions.append("unix_timestamp >= %(start_timestamp)s")
+    if end_timestamp is not None:
+        conditions.append("unix_timestamp < %(end_timestamp)s")
+    params = {"symbol": symbol, "start_timestamp": start_timestamp,
+              "end_timestamp": end_timestamp}
+
+    cursor.execute(f"DELETE FROM {SYMBOL_LATEST_TABLE_NAME} WHERE {' AND '.join(conditions)}",
+                   params)
+    if cursor.rowcount:
+        cursor.execute(get_upsert_symbol_latest_sql(SYMBOL_SPREAD_TABLE_NAME, filter_symbol=True),
+                       params)
+
+
+def refresh_symbol_latest_table(db):
+    """
+    Upsert the most recent symbol_spread entry of every symbol into the symbol_latest table, for
+    entries which were not written by the streaming script
+    """
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(text(get_upsert_symbol_latest_sql(SYMBOL_SPREAD_TABLE_NAME)))
+    except Exception as e:
+        print(f"Cannot refresh {SYMBOL_LATEST_TABLE_NAME} table: Error {e}")
+
+
 # psycopg2.connect(
 #     database=database, user=user, password=password, host=host, port=port
 # )
@@ -30,3 +91,4 @@ def reset_database(db, populate_csv_initial_data=False):
     if populate_csv_initial_data:
         # Populate DB with csv data
         populate_db_table_with_csv_data(db, SYMBOL_SPREAD_TABLE_NAME)
+        refresh_symbol_latest_table(db)
@@ -0,0 +1,207 @@
+import csv
+import io
+import zlib
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from constants import SYMBOL_SPREAD_TABLE_FIELDS, SYMBOL_SPREAD_TABLE_NAME, EXPORT_BATCH_SIZE
+
+EXPORT_FORMATS = ["arrow", "parquet", "csv"]
+EXPORT_COMPRESSIONS = {
+    "arrow": [None, "lz4", "zstd"],
+    "parquet": [None, "snappy", "gzip", "zstd"],
+    "csv": [None, "gzip"],
+}
+EXPORT_MIMETYPES = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+    "csv": "text/csv",
+}
+
+SYMBOL_SPREAD_ARROW_SCHEMA = pa.schema([
+    (field, pa.string() if field in {"symbol", "datetime"} else pa.float64())
+    for field in SYMBOL_SPREAD_TABLE_FIELDS
+])
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file object which keeps written bytes in memory until they are drained. Unlike a
+    BytesIO which is truncated after every read, tell() keeps counting from the start of the
+    stream, which the parquet writer relies on for the offsets in its footer.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_symbol_spread_batches(connection, symbol=None, start_timestamp=None, end_timestamp=None,
+                               batch_size=EXPORT_BATCH_SIZE):
+    """
+    Read symbol_spread entries in batches through a server-side cursor, so at most one batch of
+    rows is held in memory at a time
+
+    :param connection: psycopg2 connection, autocommit must be disabled for server-side cursors
+    :param str symbol: Symbol to export, None for all symbols
+    :param float start_timestamp: Inclusive lower bound on unix_timestamp
+    :param float end_timestamp: Inclusive upper bound on unix_timestamp
+    :param int batch_size: Number of rows fetched per round trip
+    :rtype: Iterator[list[tuple]]
+    :return: Batches of rows with the columns in SYMBOL_SPREAD_TABLE_FIELDS
+    """
+    conditions, params = [], {}
+    if symbol is not None:
+        conditions.append("symbol = %(symbol)s")
+        params["symbol"] = symbol
+    if start_timestamp is not None:
+        conditions.append("unix_timestamp >= %(start_timestamp)s")
+        params["start_timestamp"] = start_timestamp
+    if end_timestamp is not None:
+        conditions.append("unix_timestamp <= %(end_timestamp)s")
+        params["end_timestamp"] = end_timestamp
+    where_clause = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+
+    sql = f"SELECT {','.join(SYMBOL_SPREAD_TABLE_FIELDS)} FROM {SYMBOL_SPREAD_TABLE_NAME} " \
+          f"{where_clause}ORDER BY unix_timestamp"
+
+    cursor = connection.cursor(name=f"{SYMBOL_SPREAD_TABLE_NAME}_export")
+    cursor.itersize = batch_size
+    try:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+        connection.rollback()
+
+
+def _rows_to_record_batch(rows):
+    columns = list(zip(*rows))
+    return pa.RecordBatch.from_arrays(
+        [pa.array(column, type=field.type)
+         for column, field in zip(columns, SYMBOL_SPREAD_ARROW_SCHEMA)],
+        schema=SYMBOL_SPREAD_ARROW_SCHEMA
+    )
+
+
+def encode_arrow_batches(row_batches, compression=None):
+    """
+    Encode batches of rows as an Arrow IPC stream, one record batch per row batch
+
+    :param Iterator[list[tuple]] row_batches: Batches of symbol_spread rows
+    :param str compression: None, "lz4" or "zstd" buffer compression
+    :rtype: Iterator[bytes]
+    """
+    sink = _ChunkSink()
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+    with pa.ipc.new_stream(sink, SYMBOL_SPREAD_ARROW_SCHEMA, options=options) as writer:
+        for rows in row_batches:
+            writer.write_batch(_rows_to_record_batch(rows))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def encode_parquet_batches(row_batches, compression=None):
+    """
+    Encode batches of rows as a Parquet file, one row group per row batch
+
+    :param Iterator[list[tuple]] row_batches: Batches of symbol_spread rows
+    :param str compression: None, "snappy", "gzip" or "zstd" column compression
+    :rtype: Iterator[bytes]
+    """
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, SYMBOL_SPREAD_ARROW_SCHEMA,
+                          compression=compression or "none") as writer:
+        for rows in row_batches:
+            writer.write_table(pa.Table.from_batches([_rows_to_record_batch(rows)]))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def encode_csv_batches(row_batches, compression=None):
+    """
+    Encode batches of rows as CSV with a header line. Floats are written with repr so that they
+    round trip without loss of precision.
+
+    :param Iterator[list[tuple]] row_batches: Batches of symbol_spread rows
+    :param str compression: None or "gzip"
+    :rtype: Iterator[bytes]
+    """
+    compressor = zlib.compressobj(wbits=31) if compression == "gzip" else None
+
+    def encode(text):
+        data = text.encode()
+        return compressor.compress(data) if compressor else data
+
+    yield encode(",".join(SYMBOL_SPREAD_TABLE_FIELDS) + "\n")
+    for rows in row_batches:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        yield encode(buffer.getvalue())
+    if compressor:
+        yield compressor.flush()
+
+
+def encode_row_batches(row_batches, export_format, compression=None):
+    """
+    Encode batches of symbol_spread rows in the given format
+
+    :param Iterator[list[tuple]] row_batches: Batches of symbol_spread rows
+    :param str export_format: One of EXPORT_FORMATS
+    :param str compression: One of EXPORT_COMPRESSIONS for the format
+    :rtype: Iterator[bytes]
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {export_format}. Expected one of "
+                         f"{EXPORT_FORMATS}")
+    if compression not in EXPORT_COMPRESSIONS[export_format]:
+        raise ValueError(f"Unknown compression for {export_format}: {compression}. Expected one "
+                         f"of {EXPORT_COMPRESSIONS[export_format]}")
+
+    if export_format == "arrow":
+        return encode_arrow_batches(row_batches, compression)
+    if export_format == "parquet":
+        return encode_parquet_batches(row_batches, compression)
+    return encode_csv_batches(row_batches, compression)
+
+
+def export_symbol_spread(connection, export_format, compression=None, symbol=None,
+                         start_timestamp=None, end_timestamp=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Stream a selection of the symbol_spread table in the given format
+
+    :param connection: psycopg2 connection, autocommit must be disabled for server-side cursors
+    :param str export_format: One of EXPORT_FORMATS
+    :param str compression: One of EXPORT_COMPRESSIONS for the format
+    :param str symbol: Symbol to export, None for all symbols
+    :param float start_timestamp: Inclusive lower bound on unix_timestamp
+    :param float end_timestamp: Inclusive upper bound on unix_timestamp
+    :param int batch_size: Number of rows read and encoded at a time
+    :rtype: Iterator[bytes]
+    """
+    row_batches = iter_symbol_spread_batches(connection, symbol, start_timestamp, end_timestamp,
+                                             batch_size)
+    return encode_row_batches(row_batches, export_format, compression)
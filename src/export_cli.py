@@ -0,0 +1,159 @@
+import argparse
+import gzip
+import json
+import time
+import urllib.parse
+import urllib.request
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from constants import EXPORT_BATCH_SIZE
+from export import EXPORT_COMPRESSIONS, EXPORT_FORMATS, encode_row_batches, \
+    iter_symbol_spread_batches
+from ticker_data_streaming import DatabaseConnection, main_logger
+
+
+def export_to_file(db_connection, file_name, export_format, compression=None, symbol=None,
+                   start_timestamp=None, end_timestamp=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Export a selection of the symbol_spread table to a file
+
+    :param DatabaseConnection db_connection: A connection to a database
+    :param str file_name: File to write the export to
+    :rtype: dict
+    :return: Number of rows and bytes written, runtime and throughput
+    """
+    number_of_rows = 0
+
+    def count_rows(row_batches):
+        nonlocal number_of_rows
+        for rows in row_batches:
+            number_of_rows += len(rows)
+            yield rows
+
+    start_time = time.perf_counter()
+    number_of_bytes = 0
+    row_batches = iter_symbol_spread_batches(db_connection.connection, symbol, start_timestamp,
+                                             end_timestamp, batch_size)
+    with open(file_name, "wb") as file:
+        for chunk in encode_row_batches(count_rows(row_batches), export_format, compression):
+            file.write(chunk)
+            number_of_bytes += len(chunk)
+    runtime = time.perf_counter() - start_time
+
+    return {"format": export_format, "compression": compression, "rows": number_of_rows,
+            "bytes": number_of_bytes, "runtime_seconds": round(runtime, 3),
+            "rows_per_second": round(number_of_rows / runtime, 1) if runtime else None}
+
+
+def read_export_table(body, export_format, compression=None):
+    """
+    Decode the body of an export response into a table, as a research job reading it would
+
+    :param bytes body: Response body of the export route
+    :param str export_format: One of EXPORT_FORMATS
+    :param str compression: Compression the export was requested with
+    :rtype: pa.Table
+    """
+    if export_format == "arrow":
+        return pa.ipc.open_stream(body).read_all()
+    if export_format == "parquet":
+        return pq.read_table(pa.BufferReader(body))
+    if compression == "gzip":
+        body = gzip.decompress(body)
+    return pa_csv.read_csv(pa.BufferReader(body))
+
+
+def benchmark_export_route(base_url, symbol, export_format, compression=None):
+    """
+    Fetch and decode all entries of a symbol through the export route
+
+    :param str base_url: Base url of the flask application, e.g. http://127.0.0.1
+    :param str symbol: Symbol to fetch entries for
+    :param str export_format: One of EXPORT_FORMATS
+    :param str compression: One of EXPORT_COMPRESSIONS for the format
+    :rtype: dict
+    :return: Number of rows and bytes received, runtime and throughput
+    """
+    query = {"symbol": symbol, "format": export_format}
+    if compression is not None:
+        query["compression"] = compression
+    url = f"{base_url.rstrip('/')}/symbol_spread/export?{urllib.parse.urlencode(query)}"
+    start_time = time.perf_counter()
+    with urllib.request.urlopen(url) as response:
+        body = response.read()
+    number_of_rows = read_export_table(body, export_format, compression).num_rows
+    runtime = time.perf_counter() - start_time
+
+    return {"format": export_format, "compression": compression, "rows": number_of_rows,
+            "bytes": len(body), "runtime_seconds": round(runtime, 3),
+            "rows_per_second": round(number_of_rows / runtime, 1) if runtime else None}
+
+
+def benchmark_json_route(base_url, symbol):
+    """
+    Fetch all entries of a symbol through the json route, as research jobs did before the export
+
+    :param str base_url: Base url of the flask application, e.g. http://127.0.0.1
+    :param str symbol: Symbol to fetch entries for
+    :rtype: dict
+    :return: Number of rows and bytes received, runtime and throughput
+    """
+    url = f"{base_url.rstrip('/')}/symbol_spread/{urllib.parse.quote(symbol)}/"
+    start_time = time.perf_counter()
+    with urllib.request.urlopen(url) as response:
+        body = response.read()
+    number_of_rows = json.loads(body)["count"]
+    runtime = time.perf_counter() - start_time
+
+    return {"format": "json", "rows": number_of_rows, "bytes": len(body),
+            "runtime_seconds": round(runtime, 3),
+            "rows_per_second": round(number_of_rows / runtime, 1) if runtime else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Export symbol_spread entries as Arrow IPC, Parquet or CSV")
+    parser.add_argument("output", help="File to write the export to")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="parquet")
+    parser.add_argument("--compression", default=None,
+                        help="arrow: lz4/zstd, parquet: snappy/gzip/zstd, csv: gzip")
+    parser.add_argument("--symbol", default=None, help="Symbol to export, all symbols if omitted")
+    parser.add_argument("--start", type=float, default=None, help="Start unix timestamp")
+    parser.add_argument("--end", type=float, default=None, help="End unix timestamp")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    parser.add_argument("--benchmark-json-url", default=None,
+                        help="Base url of the flask app, compares the throughput of the export "
+                             "route with the json route for all entries of --symbol")
+    args = parser.parse_args()
+
+    if args.compression not in EXPORT_COMPRESSIONS[args.format]:
+        allowed_compressions = [c for c in EXPORT_COMPRESSIONS[args.format] if c is not None]
+        parser.error(f"--compression for {args.format} must be one of {allowed_compressions}")
+    if args.benchmark_json_url is not None:
+        if args.symbol is None:
+            parser.error("--benchmark-json-url requires --symbol")
+        if args.start is not None or args.end is not None:
+            parser.error("--benchmark-json-url compares all entries of --symbol as the json route "
+                         "has no time range, --start and --end cannot be used")
+
+    db_connection = DatabaseConnection()
+    export_report = export_to_file(db_connection, args.output, args.format, args.compression,
+                                   args.symbol, args.start, args.end, args.batch_size)
+    main_logger.info(f"Export finished: {export_report}")
+
+    if args.benchmark_json_url is not None:
+        route_report = benchmark_export_route(args.benchmark_json_url, args.symbol, args.format,
+                                              args.compression)
+        main_logger.info(f"Export route: {route_report}")
+        json_report = benchmark_json_route(args.benchmark_json_url, args.symbol)
+        main_logger.info(f"Json route: {json_report}")
+        if json_report["rows_per_second"] and route_report["rows_per_second"]:
+            speedup = route_report["rows_per_second"] / json_report["rows_per_second"]
+            main_logger.info(f"Export route throughput is {speedup:.1f}x the json route")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+TICK_PRICE_FIELDS = ["bid", "ask"]
+TICK_VALUE_FIELDS = ["bid", "ask", "bidSize", "askSize", "last"]
+
+STORE_ALL_MODE = "all"
+STORE_ON_CHANGE_MODE = "on_change"
+STORE_ON_PRICE_MOVE_MODE = "price_move"
+INGESTION_POLICY_MODES = [STORE_ALL_MODE, STORE_ON_CHANGE_MODE, STORE_ON_PRICE_MOVE_MODE]
+
+
+class IngestionStats:
+    """
+    Counters for the ticks received from the websocket and the rows written to the database
+    """
+
+    def __init__(self):
+        self.ticks_received = 0
+        self.ticks_stored = 0
+        self.heartbeats_stored = 0
+        self.ticks_conflated = 0
+
+    def get_ticks_dropped(self):
+        return self.ticks_received - self.ticks_stored
+
+    def get_store_ratio(self):
+        """
+        :rtype: float
+        :return: Fraction of received ticks which were written to the database
+        """
+        if self.ticks_received == 0:
+            return 0.0
+        return self.ticks_stored / self.ticks_received
+
+    def to_json(self):
+        return {"ticks_received": self.ticks_received, "ticks_stored": self.ticks_stored,
+                "ticks_dropped": self.get_ticks_dropped(),
+                "heartbeats_stored": self.heartbeats_stored,
+                "ticks_conflated": self.ticks_conflated,
+                "store_ratio": round(self.get_store_ratio(), 4)}
+
+
+class IngestionPolicy:
+    """
+    Decides which ticks for a single symbol are written to the database.
+
+    The mode selects the filter applied to every tick:
+        - all: store every tick received
+        - on_change: store a tick only when bid/ask/sizes/last differ from the last stored tick
+        - price_move: store a tick only when the bid or ask moved by at least min_move_ticks *
+          tick_size or min_move_bps from the last stored tick
+
+    On top of the mode, max_rows_per_sec caps the write rate by holding back the most recent
+    accepted tick (last-value conflation) until the rate allows it, and heartbeat_interval forces
+    a row to be written when nothing has been stored for that many seconds.
+    """
+
+    def __init__(self, mode=STORE_ALL_MODE, tick_size=None, min_move_ticks=None,
+                 min_move_bps=None, max_rows_per_sec=None, heartbeat_interval=None):
+        """
+        :param str mode: One of INGESTION_POLICY_MODES
+        :param float tick_size: Price increment of the symbol, used with min_move_ticks
+        :param float min_move_ticks: Minimum price move in ticks for the price_move mode
+        :param float min_move_bps: Minimum price move in basis points for the price_move mode
+        :param float max_rows_per_sec: Maximum number of rows written per second
+        :param float heartbeat_interval: Maximum number of seconds between two stored rows
+        """
+        if mode not in INGESTION_POLICY_MODES:
+            raise ValueError(f"Unknown ingestion policy mode: {mode}. "
+                             f"Expected one of {INGESTION_POLICY_MODES}")
+        if mode == STORE_ON_PRICE_MOVE_MODE:
+            if min_move_bps is None and (min_move_ticks is None or tick_size is None):
+                raise ValueError("price_move mode requires min_move_bps or both "
+                                 "min_move_ticks and tick_size")
+        if max_rows_per_sec is not None and max_rows_per_sec <= 0:
+            raise ValueError("max_rows_per_sec must be positive")
+
+        self.mode = mode
+        self.tick_size = tick_size
+        self.min_move_ticks = min_move_ticks
+        self.min_move_bps = min_move_bps
+        self.max_rows_per_sec = max_rows_per_sec
+        self.heartbeat_interval = heartbeat_interval
+        self.stats = IngestionStats()
+
+        self._last_stored_tick = None
+        self._last_stored_at = None
+        self._pending_tick = None
+
+    @classmethod
+    def from_config(cls, policy_info):
+        """
+        Build a policy from the "ingestion_policy" section of a symbol in ticker_config.json
+
+        :param dict policy_info: Policy settings, an empty dict stores every tick
+        :rtype: IngestionPolicy
+        """
+        return cls(
+            mode=policy_info.get("mode", STORE_ALL_MODE),
+            tick_size=policy_info.get("tick_size"),
+            min_move_ticks=policy_info.get("min_move_ticks"),
+            min_move_bps=policy_info.get("min_move_bps"),
+            max_rows_per_sec=policy_info.get("max_rows_per_sec"),
+            heartbeat_interval=policy_info.get("heartbeat_interval"),
+        )
+
+    def _has_changed(self, tick):
+        return any(tick.get(field) != self._last_stored_tick.get(field)
+                   for field in TICK_VALUE_FIELDS)
+
+    def _has_moved(self, tick):
+        for field in TICK_PRICE_FIELDS:
+            price, last_price = tick.get(field), self._last_stored_tick.get(field)
+            if price is None or last_price is None:
+                if price != last_price:
+                    return True
+                continue
+
+            price_move = abs(price - last_price)
+            if self.min_move_ticks is not None and self.tick_size is not None and \
+                    price_move >= self.min_move_ticks * self.tick_size - 1e-12:
+                return True
+            if self.min_move_bps is not None and last_price != 0 and \
+                    price_move / abs(last_price) * 1e4 >= self.min_move_bps:
+                return True
+        return False
+
+    def _passes_mode_filter(self, tick):
+        if self._last_stored_tick is None or self.mode == STORE_ALL_MODE:
+            return True
+        if self.mode == STORE_ON_CHANGE_MODE:
+            return self._has_changed(tick)
+        return self._has_moved(tick)
+
+    def _is_rate_limited(self, now):
+        if self.max_rows_per_sec is None or self._last_stored_at is None:
+            return False
+        return now - self._last_stored_at < 1.0 / self.max_rows_per_sec
+
+    def _is_heartbeat_due(self, now):
+        if self.heartbeat_interval is None or self._last_stored_at is None:
+            return False
+        return now - self._last_stored_at >= self.heartbeat_interval
+
+    def _store(self, tick, now):
+        self._last_stored_tick = tick
+        self._last_stored_at = now
+        self._pending_tick = None
+        self.stats.ticks_stored += 1
+        return tick
+
+    def offer(self, tick, now):
+        """
+        Offer the latest tick for a symbol to the policy
+
+        :param dict tick: Ticker data as returned by FtxWebsocketClient.get_ticker
+        :param float now: Current time in seconds, the wall clock when streaming or the tick
+            timestamp when replaying
+        :rtype: dict | None
+        :return: The tick to write to the database, or None if nothing should be written
+        """
+        self.stats.ticks_received += 1
+
+        # While a tick is held back by the rate limit, newer ticks replace it so the latest value
+        # is the one written once the rate allows it
+        if self._pending_tick is not None:
+            self.stats.ticks_conflated += 1
+            self._pending_tick = tick
+        elif self._passes_mode_filter(tick):
+            self._pending_tick = tick
+
+        if self._pending_tick is not None and not self._is_rate_limited(now):
+            if self._passes_mode_filter(self._pending_tick):
+                return self._store(self._pending_tick, now)
+            self._pending_tick = None
+
+        if self._is_heartbeat_due(now):
+            self.stats.heartbeats_stored += 1
+            return self._store(tick, now)
+
+        return None
@@ -0,0 +1,93 @@
+import argparse
+import json
+
+import pandas as pd
+
+from ticker_data_streaming import get_symbol_objects_from_config, main_logger
+
+# Approximate on-disk layout of a symbol_spread row in postgres: tuple header, line pointer,
+# integer id and six float8 columns. The symbol and datetime varchar columns are added per row
+POSTGRES_TUPLE_OVERHEAD_BYTES = 24 + 4
+SYMBOL_SPREAD_FIXED_WIDTH_BYTES = 4 + 6 * 8
+
+
+def estimate_row_size_bytes(symbol, datetime_str):
+    """
+    Estimate the heap size of a single symbol_spread row
+
+    :param str symbol: Symbol of the row
+    :param str datetime_str: Datetime string of the row, NaN when empty in the CSV
+    :rtype: int
+    :return: Estimated size in bytes, aligned to 8 bytes
+    """
+    datetime_str = "" if pd.isna(datetime_str) else datetime_str
+    varchar_bytes = (1 + len(symbol)) + (1 + len(datetime_str))
+    row_size = POSTGRES_TUPLE_OVERHEAD_BYTES + SYMBOL_SPREAD_FIXED_WIDTH_BYTES + varchar_bytes
+    return (row_size + 7) // 8 * 8
+
+
+def replay_ticks_through_policies(data_df, ticker_symbols):
+    """
+    Feed recorded ticks through each symbol's ingestion policy in timestamp order, using the tick
+    timestamps as the clock
+
+    :param pd.DataFrame data_df: Recorded symbol_spread rows
+    :param list[TickerSymbol] ticker_symbols: Symbols with their configured ingestion policies
+    :rtype: dict
+    :return: Report of received vs stored rows and estimated bytes per symbol. Bytes are modelled
+        with estimate_row_size_bytes, not measured on a postgres table
+    """
+    report = {}
+    for ticker_symbol in ticker_symbols:
+        symbol = ticker_symbol.get_symbol_name()
+        policy = ticker_symbol.get_symbol_ingestion_policy()
+        symbol_df = data_df[data_df["symbol"] == symbol].sort_values("unix_timestamp")
+
+        bytes_received, bytes_stored = 0, 0
+        for row in symbol_df.itertuples(index=False):
+            tick = {"bid": row.bid, "ask": row.ask, "bidSize": row.bid_size,
+                    "askSize": row.ask_size, "last": row.last, "time": row.unix_timestamp}
+            row_size = estimate_row_size_bytes(symbol, row.datetime)
+            bytes_received += row_size
+            if policy.offer(tick, now=row.unix_timestamp) is not None:
+                bytes_stored += row_size
+
+        symbol_report = policy.stats.to_json()
+        symbol_report.update({
+            "mode": policy.mode,
+            "estimated_bytes_received": bytes_received,
+            "estimated_bytes_stored": bytes_stored,
+            "estimated_size_reduction": round(1 - bytes_stored / bytes_received, 4)
+            if bytes_received else 0.0,
+        })
+        report[symbol] = symbol_report
+
+    total_received = sum(r["ticks_received"] for r in report.values())
+    total_stored = sum(r["ticks_stored"] for r in report.values())
+    report["total"] = {
+        "ticks_received": total_received,
+        "ticks_stored": total_stored,
+        "write_volume_reduction": round(1 - total_stored / total_received, 4)
+        if total_received else 0.0,
+        "size_estimate": "estimated_* bytes are modelled from the postgres heap tuple layout, "
+                         "excluding indexes, page overhead and TOAST, not measured",
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay recorded symbol_spread data through the ingestion policies in "
+                    "ticker_config.json and report how many rows would be written")
+    parser.add_argument("data_file", help="CSV export of the symbol_spread table")
+    parser.add_argument("--config", default="ticker_config.json", help="Ticker config file")
+    args = parser.parse_args()
+
+    data_df = pd.read_csv(args.data_file)
+    ticker_symbols = get_symbol_objects_from_config(args.config)
+    report = replay_ticks_through_policies(data_df, ticker_symbols)
+    main_logger.info(f"Ingestion policy replay report:\n{json.dumps(report, indent=2)}")
+
+
+if __name__ == "__main__":
+    main()
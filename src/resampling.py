@@ -0,0 +1,139 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+ALIGNED_FIELDS = ["mid", "bid", "ask"]
+
+
+def read_ticks_csv(csv_file):
+    """
+    Parse the CSV output of a COPY of ticks into columns. The C parser builds the arrays
+    directly instead of one Python tuple per row.
+
+    :param csv_file: Binary file object with a header line and symbol, unix_timestamp, bid and
+        ask columns
+    :rtype: pd.DataFrame
+    """
+    return pd.read_csv(csv_file, dtype={"symbol": str, "unix_timestamp": np.float64,
+                                        "bid": np.float64, "ask": np.float64})
+
+
+def build_time_grid(start_timestamp, end_timestamp, step):
+    """
+    Build the common time grid [start_timestamp, end_timestamp] with the given step
+
+    :param float start_timestamp: First grid timestamp
+    :param float end_timestamp: Last grid timestamp (included if it falls on the grid)
+    :param float step: Seconds between two grid timestamps
+    :rtype: np.ndarray
+    """
+    number_of_steps = int(np.floor((end_timestamp - start_timestamp) / step)) + 1
+    return start_timestamp + step * np.arange(max(number_of_steps, 0), dtype=np.float64)
+
+
+def align_as_of(tick_timestamps, tick_values, grid, step, ffill_limit=None):
+    """
+    Sample sorted ticks on a time grid, using for every grid timestamp the last tick at or before
+    it. A tick is carried forward for at most ffill_limit grid steps after the step it falls in,
+    grid timestamps without a recent enough tick are NaN.
+
+    :param np.ndarray tick_timestamps: Sorted tick timestamps
+    :param dict[str, np.ndarray] tick_values: Tick values per field, aligned with tick_timestamps
+    :param np.ndarray grid: Time grid to sample on
+    :param float step: Seconds between two grid timestamps
+    :param int ffill_limit: Maximum number of steps a tick is carried forward, None for no limit
+    :rtype: dict[str, np.ndarray]
+    :return: Values per field sampled on the grid
+    """
+    tick_indexes = np.searchsorted(tick_timestamps, grid, side="right") - 1
+    has_tick = tick_indexes >= 0
+    tick_indexes = np.clip(tick_indexes, 0, None)
+
+    if ffill_limit is not None and len(tick_timestamps) > 0:
+        tick_age = grid - tick_timestamps[tick_indexes]
+        has_tick &= tick_age < (ffill_limit + 1) * step
+
+    aligned_values = {}
+    for field, values in tick_values.items():
+        if len(values) == 0:
+            aligned_values[field] = np.full(len(grid), np.nan)
+            continue
+        aligned_values[field] = np.where(has_tick, values[tick_indexes], np.nan)
+    return aligned_values
+
+
+def align_symbols(ticks_df, symbols, grid, step, ffill_limit=None):
+    """
+    Build dense matrices of as-of mid/bid/ask prices with one row per grid timestamp and one
+    column per symbol
+
+    :param pd.DataFrame ticks_df: Ticks with symbol, unix_timestamp, bid and ask columns, sorted
+        by symbol and unix_timestamp
+    :param list[str] symbols: Symbols in column order
+    :param np.ndarray grid: Time grid to sample on
+    :param float step: Seconds between two grid timestamps
+    :param int ffill_limit: Maximum number of steps a tick is carried forward, None for no limit
+    :rtype: dict[str, np.ndarray]
+    :return: Matrix of shape (len(grid), len(symbols)) per field in ALIGNED_FIELDS
+    """
+    matrices = {field: np.full((len(grid), len(symbols)), np.nan) for field in ALIGNED_FIELDS}
+    symbol_row_indexes = ticks_df.groupby("symbol").indices
+
+    timestamps = ticks_df["unix_timestamp"].to_numpy(dtype=np.float64)
+    bids = ticks_df["bid"].to_numpy(dtype=np.float64)
+    asks = ticks_df["ask"].to_numpy(dtype=np.float64)
+
+    for column, symbol in enumerate(symbols):
+        row_indexes = symbol_row_indexes.get(symbol)
+        if row_indexes is None:
+            continue
+        symbol_bids, symbol_asks = bids[row_indexes], asks[row_indexes]
+        aligned_values = align_as_of(
+            timestamps[row_indexes],
+            {"bid": symbol_bids, "ask": symbol_asks, "mid": (symbol_bids + symbol_asks) / 2},
+            grid, step, ffill_limit
+        )
+        for field in ALIGNED_FIELDS:
+            matrices[field][:, column] = aligned_values[field]
+    return matrices
+
+
+def rolling_correlation(mid_matrix, window):
+    """
+    Rolling correlation of the mid price returns of every symbol with the first symbol
+
+    :param np.ndarray mid_matrix: Matrix of aligned mid prices, one column per symbol
+    :param int window: Number of returns in every correlation window
+    :rtype: np.ndarray
+    :return: Matrix of the same shape as mid_matrix, NaN until a full window is available
+    """
+    returns = np.full(mid_matrix.shape, np.nan)
+    returns[1:] = mid_matrix[1:] / mid_matrix[:-1] - 1
+    returns_df = pd.DataFrame(returns)
+    return returns_df.rolling(window, min_periods=window).corr(returns_df[0]).to_numpy()
+
+
+def matrix_to_json_columns(matrix, symbols):
+    """
+    Convert a matrix with one column per symbol to a dict of lists, NaN values become None
+
+    :rtype: dict[str, list]
+    """
+    # NaN is the only float which is not equal to itself
+    return {symbol: [value if value == value else None for value in matrix[:, column].tolist()]
+            for column, symbol in enumerate(symbols)}
+
+
+def encode_aligned_npz(grid, symbols, matrices):
+    """
+    Encode the aligned matrices in a numpy .npz archive: a float64 "timestamps" array, a "symbols"
+    string array and one float64 (timestamps x symbols) matrix per field. The archive is not
+    compressed: price matrices only shrink by about a third while deflating them takes longer
+    than building them (benchmarks/aligned_resampling.py).
+
+    :rtype: bytes
+    """
+    buffer = io.BytesIO()
+    np.savez(buffer, timestamps=grid, symbols=np.array(symbols), **matrices)
+    return buffer.getvalue()
@@ -0,0 +1,299 @@
+import time
+
+from constants import SYMBOL_SPREAD_TABLE_NAME, RETENTION_DEFAULT_BATCH_SIZE, \
+    RETENTION_DEFAULT_BATCH_PAUSE, RETENTION_DOWNSAMPLE_WINDOW_BUCKETS, \
+    RETENTION_WATERMARK_TABLE_NAME
+from db_utils import refresh_symbol_latest_entry
+
+
+class RetentionPolicy:
+    """
+    Per-symbol retention settings used by the background retention job.
+
+    Ticks older than max_age_seconds are deleted. Ticks older than downsample_after_seconds are
+    downsampled by keeping only the last tick of every downsample_interval seconds bucket.
+    Deletes run in batches of batch_size rows with batch_pause seconds between batches so that
+    the job does not compete with ingestion for locks and I/O.
+    """
+
+    def __init__(self, max_age_seconds=None, downsample_after_seconds=None,
+                 downsample_interval=None, batch_size=RETENTION_DEFAULT_BATCH_SIZE,
+                 batch_pause=RETENTION_DEFAULT_BATCH_PAUSE):
+        """
+        :param float max_age_seconds: Age after which ticks are deleted
+        :param float downsample_after_seconds: Age after which ticks are downsampled
+        :param float downsample_interval: Bucket size in seconds of downsampled ticks
+        :param int batch_size: Maximum number of rows deleted per statement
+        :param float batch_pause: Seconds to sleep between two batches
+        """
+        if downsample_after_seconds is not None and not downsample_interval:
+            raise ValueError("downsample_after_seconds requires a downsample_interval")
+        if batch_size <= 0:
+            raise ValueError("batch_size must be positive")
+
+        self.max_age_seconds = max_age_seconds
+        self.downsample_after_seconds = downsample_after_seconds
+        self.downsample_interval = downsample_interval
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+
+    @classmethod
+    def from_config(cls, policy_info):
+        """
+        Build a policy from the "retention_policy" section of a symbol in ticker_config.json
+
+        :param dict policy_info: Policy settings
+        :rtype: RetentionPolicy
+        """
+        return cls(
+            max_age_seconds=policy_info.get("max_age_seconds"),
+            downsample_after_seconds=policy_info.get("downsample_after_seconds"),
+            downsample_interval=policy_info.get("downsample_interval"),
+            batch_size=policy_info.get("batch_size", RETENTION_DEFAULT_BATCH_SIZE),
+            batch_pause=policy_info.get("batch_pause", RETENTION_DEFAULT_BATCH_PAUSE),
+        )
+
+
+def _build_time_range_filter(start_timestamp, end_timestamp):
+    """
+    Build the SQL condition on unix_timestamp for an optional [start, end) range
+
+    :rtype: str
+    """
+    conditions = ["symbol = %(symbol)s"]
+    if start_timestamp is not None:
+        conditions.append("unix_timestamp >= %(start_timestamp)s")
+    if end_timestamp is not None:
+        conditions.append("unix_timestamp < %(end_timestamp)s")
+    return " AND ".join(conditions)
+
+
+def _delete_in_batches(connection, sql, params, batch_pause, refresh_symbol_latest=True):
+    """
+    Repeatedly execute a DELETE statement bounded by a LIMIT, committing after every batch, until
+    it no longer deletes any rows. Unless refresh_symbol_latest is disabled, the symbol_latest row
+    of the symbol is refreshed in the transaction of every batch which deleted rows if it falls in
+    the deleted range, so it never points at a deleted entry.
+
+    :param connection: DBAPI connection to the postgres database
+    :param str sql: DELETE statement deleting at most one batch of rows
+    :param dict params: Parameters of the statement, including the symbol and the
+        start_timestamp and end_timestamp of the range rows are deleted from
+    :param float batch_pause: Seconds to sleep between two batches
+    :param bool refresh_symbol_latest: False if the statement can never delete the latest entry
+    :rtype: int
+    :return: Total number of deleted rows
+    """
+    total_deleted_rows = 0
+    cursor = connection.cursor()
+    try:
+        while True:
+            cursor.execute(sql, params)
+            deleted_rows = cursor.rowcount
+            if deleted_rows and refresh_symbol_latest:
+                refresh_symbol_latest_entry(cursor, params["symbol"], params["start_timestamp"],
+                                            params["end_timestamp"])
+            connection.commit()
+            total_deleted_rows += deleted_rows
+
+            if deleted_rows < params["batch_size"]:
+                break
+            if batch_pause:
+                time.sleep(batch_pause)
+    finally:
+        cursor.close()
+    return total_deleted_rows
+
+
+def bulk_delete_symbol_range(connection, symbol, start_timestamp=None, end_timestamp=None,
+                             batch_size=RETENTION_DEFAULT_BATCH_SIZE,
+                             batch_pause=RETENTION_DEFAULT_BATCH_PAUSE):
+    """
+    Delete every entry of a symbol with a unix_timestamp in [start_timestamp, end_timestamp).
+    Rows are deleted in batches of batch_size, each in its own transaction.
+
+    :param connection: DBAPI connection to the postgres database
+    :param str symbol: Symbol to delete entries for
+    :param float start_timestamp: Inclusive lower bound, None for no lower bound
+    :param float end_timestamp: Exclusive upper bound, None for no upper bound
+    :param int batch_size: Maximum number of rows deleted per statement
+    :param float batch_pause: Seconds to sleep between two batches
+    :rtype: int
+    :return: Number of deleted rows
+    """
+    # ctid is used instead of id as tables populated from csv do not have an id column
+    sql = f"DELETE FROM {SYMBOL_SPREAD_TABLE_NAME} WHERE ctid = ANY(ARRAY(" \
+          f"SELECT ctid FROM {SYMBOL_SPREAD_TABLE_NAME} " \
+          f"WHERE {_build_time_range_filter(start_timestamp, end_timestamp)} " \
+          f"LIMIT %(batch_size)s))"
+    params = {"symbol": symbol, "start_timestamp": start_timestamp,
+              "end_timestamp": end_timestamp, "batch_size": batch_size}
+    return _delete_in_batches(connection, sql, params, batch_pause)
+
+
+def get_downsample_watermark(connection, symbol, interval):
+    """
+    Fetch the timestamp up to which a symbol was already downsampled with the given interval
+
+    :param connection: DBAPI connection to the postgres database
+    :param str symbol: Symbol to fetch the watermark for
+    :param float interval: Bucket size in seconds, a watermark for another interval is ignored
+    :rtype: float | None
+    :return: Exclusive upper bound of the downsampled entries, None if never downsampled
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"SELECT downsample_interval, downsampled_until "
+                       f"FROM {RETENTION_WATERMARK_TABLE_NAME} WHERE symbol = %(symbol)s",
+                       {"symbol": symbol})
+        watermark = cursor.fetchone()
+        connection.commit()
+    finally:
+        cursor.close()
+
+    if watermark is None or watermark[0] != interval:
+        return None
+    return watermark[1]
+
+
+def set_downsample_watermark(connection, symbol, interval, downsampled_until):
+    """
+    Record the timestamp up to which a symbol was downsampled with the given interval
+
+    :param connection: DBAPI connection to the postgres database
+    :param str symbol: Symbol to record the watermark for
+    :param float interval: Bucket size in seconds
+    :param float downsampled_until: Exclusive upper bound of the downsampled entries
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"INSERT INTO {RETENTION_WATERMARK_TABLE_NAME} "
+                       f"(symbol, downsample_interval, downsampled_until) "
+                       f"VALUES (%(symbol)s, %(interval)s, %(downsampled_until)s) "
+                       f"ON CONFLICT (symbol) DO UPDATE SET "
+                       f"downsample_interval = EXCLUDED.downsample_interval, "
+                       f"downsampled_until = EXCLUDED.downsampled_until",
+                       {"symbol": symbol, "interval": interval,
+                        "downsampled_until": downsampled_until})
+        connection.commit()
+    finally:
+        cursor.close()
+
+
+def downsample_symbol_range(connection, symbol, end_timestamp, interval,
+                            batch_size=RETENTION_DEFAULT_BATCH_SIZE,
+                            batch_pause=RETENTION_DEFAULT_BATCH_PAUSE):
+    """
+    Downsample entries of a symbol older than end_timestamp to one row per interval seconds,
+    keeping the last tick of every bucket. The range is processed in windows of
+    RETENTION_DOWNSAMPLE_WINDOW_BUCKETS buckets so that every statement only scans a bounded
+    number of rows. Processing starts at the watermark left by the previous run, so history which
+    was already downsampled is not scanned again; entries inserted behind the watermark later on
+    are not downsampled. A watermark beyond the newest entry of the symbol is left over from data
+    which has since been removed, processing then starts at the oldest entry again.
+
+    :param connection: DBAPI connection to the postgres database
+    :param str symbol: Symbol to downsample entries for
+    :param float end_timestamp: Exclusive upper bound of the entries to downsample
+    :param float interval: Bucket size in seconds
+    :param int batch_size: Maximum number of rows deleted per statement
+    :param float batch_pause: Seconds to sleep between two batches
+    :rtype: int
+    :return: Number of deleted rows
+    """
+    watermark = get_downsample_watermark(connection, symbol, interval)
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"SELECT min(unix_timestamp), max(unix_timestamp) "
+                       f"FROM {SYMBOL_SPREAD_TABLE_NAME} WHERE symbol = %(symbol)s",
+                       {"symbol": symbol})
+        oldest_timestamp, newest_timestamp = cursor.fetchone()
+        connection.commit()
+    finally:
+        cursor.close()
+    if oldest_timestamp is None:
+        return 0
+
+    first_timestamp = watermark
+    if watermark is None or watermark > newest_timestamp:
+        first_timestamp = oldest_timestamp
+
+    sql = f"DELETE FROM {SYMBOL_SPREAD_TABLE_NAME} WHERE ctid = ANY(ARRAY(" \
+          f"SELECT ctid FROM (" \
+          f"SELECT ctid, row_number() OVER (" \
+          f"PARTITION BY floor(unix_timestamp / %(interval)s) " \
+          f"ORDER BY unix_timestamp DESC) AS bucket_rank " \
+          f"FROM {SYMBOL_SPREAD_TABLE_NAME} " \
+          f"WHERE symbol = %(symbol)s AND unix_timestamp >= %(start_timestamp)s " \
+          f"AND unix_timestamp < %(end_timestamp)s" \
+          f") ranked WHERE bucket_rank > 1 LIMIT %(batch_size)s))"
+
+    window_size = interval * RETENTION_DOWNSAMPLE_WINDOW_BUCKETS
+    # Only downsample complete buckets
+    end_timestamp = (end_timestamp // interval) * interval
+    window_start = (first_timestamp // interval) * interval
+
+    total_deleted_rows = 0
+    while window_start < end_timestamp:
+        window_end = min(window_start + window_size, end_timestamp)
+        params = {"symbol": symbol, "interval": interval, "start_timestamp": window_start,
+                  "end_timestamp": window_end, "batch_size": batch_size}
+        # The last tick of every bucket is kept, so the latest entry of the symbol is never deleted
+        total_deleted_rows += _delete_in_batches(connection, sql, params, batch_pause,
+                                                 refresh_symbol_latest=False)
+        # Advance the watermark after every window so an interrupted run resumes where it stopped
+        set_downsample_watermark(connection, symbol, interval, window_end)
+        window_start = window_end
+    return total_deleted_rows
+
+
+def vacuum_analyze_table(connection, table_name=SYMBOL_SPREAD_TABLE_NAME):
+    """
+    Run VACUUM ANALYZE on a table so that space of deleted rows can be reused and planner
+    statistics reflect the new table contents. VACUUM cannot run inside a transaction, so
+    autocommit is enabled for the duration of the call.
+
+    :param connection: psycopg2 connection to the postgres database
+    :param str table_name: Table to vacuum
+    """
+    previous_autocommit = connection.autocommit
+    connection.autocommit = True
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"VACUUM (ANALYZE) {table_name}")
+        cursor.close()
+    finally:
+        connection.autocommit = previous_autocommit
+
+
+def apply_retention_policy(connection, symbol, retention_policy, now=None):
+    """
+    Delete and downsample the entries of a symbol according to its retention policy
+
+    :param connection: DBAPI connection to the postgres database
+    :param str symbol: Symbol to apply the policy to
+    :param RetentionPolicy retention_policy: Retention settings of the symbol
+    :param float now: Current unix timestamp, defaults to the wall clock
+    :rtype: dict
+    :return: Number of rows deleted and downsampled, and the runtime in seconds
+    """
+    now = time.time() if now is None else now
+    start_time = time.perf_counter()
+    deleted_rows, downsampled_rows = 0, 0
+
+    if retention_policy.max_age_seconds is not None:
+        deleted_rows = bulk_delete_symbol_range(
+            connection, symbol, end_timestamp=now - retention_policy.max_age_seconds,
+            batch_size=retention_policy.batch_size, batch_pause=retention_policy.batch_pause
+        )
+
+    if retention_policy.downsample_after_seconds is not None:
+        downsampled_rows = downsample_symbol_range(
+            connection, symbol, end_timestamp=now - retention_policy.downsample_after_seconds,
+            interval=retention_policy.downsample_interval,
+            batch_size=retention_policy.batch_size, batch_pause=retention_policy.batch_pause
+        )
+
+    return {"symbol": symbol, "deleted_rows": deleted_rows, "downsampled_rows": downsampled_rows,
+            "rows_reclaimed": deleted_rows + downsampled_rows,
+            "runtime_seconds": round(time.perf_counter() - start_time, 3)}
@@ -0,0 +1,69 @@
+import argparse
+import time
+
+from constants import RETENTION_JOB_INTERVAL
+from retention import apply_retention_policy, vacuum_analyze_table
+from ticker_data_streaming import DatabaseConnection, get_symbol_objects_from_config, main_logger
+
+
+def run_retention_once(db_connection, ticker_symbols):
+    """
+    Apply the retention policy of every symbol which defines one, then vacuum and analyze the
+    table if any rows were reclaimed
+
+    :param DatabaseConnection db_connection: A connection to a database
+    :param list[TickerSymbol] ticker_symbols: Symbols with their configured retention policies
+    :rtype: dict
+    :return: Report of rows reclaimed and runtime per symbol
+    """
+    start_time = time.perf_counter()
+    symbol_reports = []
+    for ticker_symbol in ticker_symbols:
+        retention_policy = ticker_symbol.get_symbol_retention_policy()
+        if retention_policy is None:
+            continue
+        symbol_report = apply_retention_policy(
+            db_connection.connection, ticker_symbol.get_symbol_name(), retention_policy
+        )
+        main_logger.info(f"Retention report: {symbol_report}")
+        symbol_reports.append(symbol_report)
+
+    rows_reclaimed = sum(report["rows_reclaimed"] for report in symbol_reports)
+    vacuum_runtime = 0.0
+    if rows_reclaimed > 0:
+        vacuum_start_time = time.perf_counter()
+        vacuum_analyze_table(db_connection.connection)
+        vacuum_runtime = time.perf_counter() - vacuum_start_time
+
+    return {"symbols": symbol_reports, "rows_reclaimed": rows_reclaimed,
+            "vacuum_runtime_seconds": round(vacuum_runtime, 3),
+            "runtime_seconds": round(time.perf_counter() - start_time, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Delete and downsample old symbol_spread entries according to the retention "
+                    "policies in ticker_config.json")
+    parser.add_argument("--config", default="ticker_config.json", help="Ticker config file")
+    parser.add_argument("--interval", type=float, default=RETENTION_JOB_INTERVAL,
+                        help="Seconds between two retention runs")
+    parser.add_argument("--once", action="store_true", help="Run a single retention pass")
+    args = parser.parse_args()
+
+    ticker_symbols = get_symbol_objects_from_config(args.config)
+    db_connection = DatabaseConnection()
+
+    try:
+        while True:
+            report = run_retention_once(db_connection, ticker_symbols)
+            main_logger.info(f"Retention run finished: reclaimed {report['rows_reclaimed']} rows "
+                             f"in {report['runtime_seconds']}s")
+            if args.once:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        main_logger.info("Stopped - Keyboard interrupt")
+
+
+if __name__ == "__main__":
+    main()
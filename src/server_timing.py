@@ -0,0 +1,67 @@
+import time
+
+from flask import g, has_request_context
+from sqlalchemy import event
+
+
+def get_resident_memory_kb():
+    """
+    Read the current resident memory of the process from /proc/self/status
+
+    :rtype: int | None
+    :return: VmRSS in kB, None where /proc is not available
+    """
+    try:
+        with open("/proc/self/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def init_server_timing(app, engine):
+    """
+    Report per-request timings in a Server-Timing header, used by the load tests to split request
+    latency into database time and the time spent building and serializing the response:
+
+        Server-Timing: db;dur=1.234, app;dur=5.678, total;dur=6.912
+
+    db is the time spent executing statements through the SQLAlchemy engine, app is the rest of
+    the request (fetching rows into objects and serializing them). The resident memory of the
+    process at the end of the request, while the response is still held, is reported in the
+    X-RSS-KB header, so a load test can take the peak over its own requests instead of the peak
+    over the lifetime of the process. Statements executed on raw DBAPI connections are not
+    included in db.
+
+    :param Flask app: Flask application to instrument
+    :param Engine engine: SQLAlchemy engine used by the application
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_times", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        query_time = time.perf_counter() - conn.info["query_start_times"].pop()
+        if has_request_context():
+            g.db_time = g.get("db_time", 0.0) + query_time
+
+    @app.before_request
+    def start_request_timer():
+        g.request_start_time = time.perf_counter()
+        g.db_time = 0.0
+
+    @app.after_request
+    def add_server_timing_headers(response):
+        total_time = time.perf_counter() - g.request_start_time
+        db_time = g.get("db_time", 0.0)
+        response.headers["Server-Timing"] = f"db;dur={db_time * 1000:.3f}, " \
+                                            f"app;dur={(total_time - db_time) * 1000:.3f}, " \
+                                            f"total;dur={total_time * 1000:.3f}"
+        resident_memory_kb = get_resident_memory_kb()
+        if resident_memory_kb is not None:
+            response.headers["X-RSS-KB"] = str(resident_memory_kb)
+        return response
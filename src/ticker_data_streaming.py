@@ -2,12 +2,17 @@ import asyncio
 import json
 import logging
 import os
+import time
 from datetime import datetime
 
 import psycopg2
 from dotenv import load_dotenv
 
-from constants import SYMBOL_SPREAD_TABLE_NAME, SYMBOL_SPREAD_TABLE_FIELDS
+from constants import SYMBOL_SPREAD_TABLE_NAME, SYMBOL_SPREAD_TABLE_FIELDS, \
+    INGESTION_STATS_LOG_INTERVAL, INGESTION_FLUSH_INTERVAL, INGESTION_FLUSH_MAX_ENTRIES
+from db_utils import get_upsert_symbol_latest_sql
+from ingestion_policy import IngestionPolicy
+from retention import RetentionPolicy
 from websocket_ftx.client import FtxWebsocketClient
 
 # Load in the .env file with FTX credentials
@@ -37,67 +42,124 @@ def unix_timestamp_to_datetime(unix_timestamp):
     return date_time_str
 
 
-def write_entry_data_to_db(db_connection, symbol, bid_ask_data):
+def write_entries_data_to_db(db_connection, symbol_entries):
     """
-    Given a single data point from the websocket, write this to the postgres db
-    
+    Write a batch of data points from the websocket to the postgres db and upsert the latest
+    entry of every symbol into the symbol_latest table. Both happen in a single statement, so the
+    symbol_latest table never gets ahead of or falls behind the symbol_spread table.
+
     :param DatabaseConnection db_connection: A connection to a database
-    :param symbol: The symbol which data was collected for
-    :param dict bid_ask_data: The latest ticker information on the symbol
+    :param list[tuple[str, dict]] symbol_entries: Pairs of symbol and the latest ticker
+        information on the symbol
     """
-    datetime_str = unix_timestamp_to_datetime(bid_ask_data.get("time"))
-
-    values_str_list = ",".join([str(field) for field in bid_ask_data.values()])
-    bid_ask_entry_values = f"{values_str_list},'{symbol}','{datetime_str}'"
-
-    sql = f"INSERT INTO {SYMBOL_SPREAD_TABLE_NAME} ({','.join(SYMBOL_SPREAD_TABLE_FIELDS)}) " \
-          f"VALUES ({bid_ask_entry_values})"
+    if not symbol_entries:
+        return
+
+    values_sql = ",".join(
+        db_connection.cursor.mogrify("(%s,%s,%s,%s,%s,%s,%s,%s)", (
+            bid_ask_data.get("bid"), bid_ask_data.get("ask"), bid_ask_data.get("bidSize"),
+            bid_ask_data.get("askSize"), bid_ask_data.get("last"), bid_ask_data.get("time"),
+            symbol, unix_timestamp_to_datetime(bid_ask_data.get("time"))
+        )).decode()
+        for symbol, bid_ask_data in symbol_entries
+    )
+    fields = ",".join(SYMBOL_SPREAD_TABLE_FIELDS)
+    sql = f"WITH inserted AS (" \
+          f"INSERT INTO {SYMBOL_SPREAD_TABLE_NAME} ({fields}) VALUES {values_sql} " \
+          f"RETURNING {fields}) " \
+          f"{get_upsert_symbol_latest_sql('inserted')}"
     main_logger.info(f"Executing SQL: {sql}")
     db_connection.cursor.execute(sql)
 
 
-async def subscribe_to_symbol_ws_and_write_to_db(db_connection, websocket, symbol, ticker_interval):
+def flush_entries_to_db(db_connection, pending_entries):
+    """
+    Write every buffered entry to the database in one statement and empty the buffer
+
+    :param DatabaseConnection db_connection: A connection to a database
+    :param list[tuple[str, dict]] pending_entries: Buffer of symbol and ticker information pairs
+    """
+    # Swap the buffer before writing, coroutines keep appending to the emptied list
+    symbol_entries = pending_entries[:]
+    pending_entries.clear()
+    write_entries_data_to_db(db_connection, symbol_entries)
+
+
+async def flush_entries_to_db_periodically(db_connection, pending_entries,
+                                           flush_interval=INGESTION_FLUSH_INTERVAL):
+    """
+    Flush the buffered entries of all symbols every flush_interval seconds. Entries still buffered
+    when the streaming is stopped are flushed before returning.
+
+    :param DatabaseConnection db_connection: A connection to a database
+    :param list[tuple[str, dict]] pending_entries: Buffer shared with the symbol coroutines
+    :param float flush_interval: Seconds between two flushes
     """
-    Fetch ticker data and write to the database
+    try:
+        while True:
+            await asyncio.sleep(flush_interval)
+            flush_entries_to_db(db_connection, pending_entries)
+    finally:
+        flush_entries_to_db(db_connection, pending_entries)
+
+
+async def subscribe_to_symbol_ws_and_write_to_db(db_connection, websocket, symbol, ticker_interval,
+                                                 ingestion_policy, pending_entries):
+    """
+    Fetch ticker data and buffer it for the database. The buffer is flushed periodically by
+    flush_entries_to_db_periodically, or here once it holds INGESTION_FLUSH_MAX_ENTRIES entries.
 
     :param DatabaseConnection db_connection: A connection to a database
     :param FtxWebsocketClient websocket:  The connected websocket
     :param symbol: The symbol to stream data for
     :param float ticker_interval: The interval between consecutive calls to for a symbol to the
         websocket
+    :param IngestionPolicy ingestion_policy: Decides which ticks are written to the database
+    :param list[tuple[str, dict]] pending_entries: Buffer shared by the coroutines of all symbols
     """
+    last_stats_logged_at = time.time()
     while True:
         bid_ask_data = websocket.get_ticker(market=symbol)
         if len(bid_ask_data) > 0:
-            # Write to DB
-            write_entry_data_to_db(db_connection=db_connection, symbol=symbol,
-                                   bid_ask_data=bid_ask_data)
+            entry_to_store = ingestion_policy.offer(bid_ask_data, now=time.time())
+            if entry_to_store is not None:
+                pending_entries.append((symbol, entry_to_store))
+                if len(pending_entries) >= INGESTION_FLUSH_MAX_ENTRIES:
+                    flush_entries_to_db(db_connection, pending_entries)
         else:
             main_logger.info(f"No data available for {symbol}")
 
+        if time.time() - last_stats_logged_at >= INGESTION_STATS_LOG_INTERVAL:
+            main_logger.info(f"{symbol} ingestion stats: {ingestion_policy.stats.to_json()}")
+            last_stats_logged_at = time.time()
+
         main_logger.info(f"{symbol} bid_ask_data: {bid_ask_data}")
         await asyncio.sleep(ticker_interval)
 
 
 async def stream_and_write_data_to_db(db_connection, websocket, ticker_symbols):
     """
-    Using asynchronous processors - create a subroutine to stream data and write to a database for
-    every symbol
+    Using asynchronous processors - create a subroutine to stream data for every symbol, and one
+    which writes the data of all symbols to a database in batches
 
     :param DatabaseConnection db_connection: A connection to a database
     :param FtxWebsocketClient websocket:  The connected websocket
     :param list[TickerSymbol] ticker_symbols: List of symbols to stream data for
     """
+    pending_entries = []
     async_symbol_streaming_coroutines = []
     for symbol_id, ticker_symbol_obj in enumerate(ticker_symbols):
         ticker_symbol = ticker_symbol_obj.get_symbol_name()
         streaming_coroutine = subscribe_to_symbol_ws_and_write_to_db(
             db_connection=db_connection, websocket=websocket, symbol=ticker_symbol,
-            ticker_interval=ticker_symbol_obj.get_symbol_ticker_interval()
+            ticker_interval=ticker_symbol_obj.get_symbol_ticker_interval(),
+            ingestion_policy=ticker_symbol_obj.get_symbol_ingestion_policy(),
+            pending_entries=pending_entries
         )
         async_symbol_streaming_coroutines.append(streaming_coroutine)
 
     await asyncio.gather(
+        flush_entries_to_db_periodically(db_connection, pending_entries),
         *async_symbol_streaming_coroutines
     )
 
@@ -180,6 +242,12 @@ class TickerSymbol:
         """
         self.symbol_name = symbol_name
         self.ticker_interval = symbol_info.get("ticker_interval")
+        self.ingestion_policy = IngestionPolicy.from_config(
+            symbol_info.get("ingestion_policy", {})
+        )
+        retention_policy_info = symbol_info.get("retention_policy")
+        self.retention_policy = RetentionPolicy.from_config(retention_policy_info) \
+            if retention_policy_info is not None else None
 
     def get_symbol_name(self):
         return self.symbol_name
@@ -187,6 +255,12 @@ class TickerSymbol:
     def get_symbol_ticker_interval(self):
         return self.ticker_interval
 
+    def get_symbol_ingestion_policy(self):
+        return self.ingestion_policy
+
+    def get_symbol_retention_policy(self):
+        return self.retention_policy
+
 
 def get_symbol_objects_from_config(file_name="ticker_config.json"):
     """
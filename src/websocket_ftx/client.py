@@ -2,21 +2,27 @@ import hmac
 import json
 import time
 import zlib
-from collections import defaultdict, deque
+from collections import defaultdict
 from itertools import zip_longest
-from typing import DefaultDict, Deque, List, Dict, Tuple, Optional
+from typing import DefaultDict, List, Dict, Tuple, Optional
 from gevent.event import Event
 
+from websocket_ftx.records import FillRecord, RecordBuffer, TickerRecord, TradeRecord
 from websocket_ftx.websocket_manager import WebsocketManager
 
 
 class FtxWebsocketClient(WebsocketManager):
     _ENDPOINT = 'wss://ftx.com/ws/'
+    _DEFAULT_TRADES_MAXLEN = 10000
+    _DEFAULT_FILLS_MAXLEN = 10000
 
-    def __init__(self, api_key, api_secret) -> None:
+    def __init__(self, api_key, api_secret, trades_maxlen: int = _DEFAULT_TRADES_MAXLEN,
+                 fills_maxlen: int = _DEFAULT_FILLS_MAXLEN) -> None:
         super().__init__()
-        self._trades: DefaultDict[str, Deque] = defaultdict(lambda: deque([], maxlen=10000))
-        self._fills: Deque = deque([], maxlen=10000)
+        self._trades_maxlen = trades_maxlen
+        self._trades_maxlen_by_market: Dict[str, int] = {}
+        self._trades: Dict[str, RecordBuffer[TradeRecord]] = {}
+        self._fills: RecordBuffer[FillRecord] = RecordBuffer(fills_maxlen)
         self._api_key = api_key
         self._api_secret = api_secret
         self._orderbook_update_events: DefaultDict[str, Event] = defaultdict(Event)
@@ -28,7 +34,7 @@ class FtxWebsocketClient(WebsocketManager):
     def _reset_data(self) -> None:
         self._subscriptions: List[Dict] = []
         self._orders: DefaultDict[int, Dict] = defaultdict(dict)
-        self._tickers: DefaultDict[str, Dict] = defaultdict(dict)
+        self._tickers: Dict[str, TickerRecord] = {}
         self._orderbook_timestamps: DefaultDict[str, float] = defaultdict(float)
         self._orderbook_update_events.clear()
         self._orderbooks: DefaultDict[str, Dict[str, DefaultDict[float, float]]] = defaultdict(
@@ -65,13 +71,42 @@ class FtxWebsocketClient(WebsocketManager):
         while subscription in self._subscriptions:
             self._subscriptions.remove(subscription)
 
-    def get_fills(self) -> List[Dict]:
+    def set_trades_retention(self, maxlen: int, market: Optional[str] = None) -> None:
+        """Set how many trades are kept for a market, or for every market if none is given"""
+        if market is None:
+            self._trades_maxlen = maxlen
+            self._trades_maxlen_by_market.clear()
+            for trades in self._trades.values():
+                trades.set_maxlen(maxlen)
+        else:
+            self._trades_maxlen_by_market[market] = maxlen
+            if market in self._trades:
+                self._trades[market].set_maxlen(maxlen)
+
+    def set_fills_retention(self, maxlen: int) -> None:
+        self._fills.set_maxlen(maxlen)
+
+    def _get_trades_buffer(self, market: str) -> RecordBuffer[TradeRecord]:
+        if market not in self._trades:
+            self._trades[market] = RecordBuffer(
+                self._trades_maxlen_by_market.get(market, self._trades_maxlen))
+        return self._trades[market]
+
+    def _subscribe_to_fills(self) -> None:
         if not self._logged_in:
             self._login()
         subscription = {'channel': 'fills'}
         if subscription not in self._subscriptions:
             self._subscribe(subscription)
-        return list(self._fills.copy())
+
+    def get_fills(self) -> List[Dict]:
+        self._subscribe_to_fills()
+        return [fill.to_dict() for fill in self._fills.get_all()]
+
+    def get_fills_since(self, cursor: int = 0) -> Tuple[List[FillRecord], int]:
+        """Return the fills received since the cursor and the cursor to pass to the next call"""
+        self._subscribe_to_fills()
+        return self._fills.get_since(cursor)
 
     def get_orders(self) -> Dict[int, Dict]:
         if not self._logged_in:
@@ -81,11 +116,23 @@ class FtxWebsocketClient(WebsocketManager):
             self._subscribe(subscription)
         return dict(self._orders.copy())
 
-    def get_trades(self, market: str) -> List[Dict]:
+    def _subscribe_to_trades(self, market: str) -> None:
         subscription = {'channel': 'trades', 'market': market}
         if subscription not in self._subscriptions:
             self._subscribe(subscription)
-        return list(self._trades[market].copy())
+
+    def get_trades(self, market: str) -> List[Dict]:
+        self._subscribe_to_trades(market)
+        if market not in self._trades:
+            return []
+        return [trade.to_dict() for trade in self._trades[market].get_all()]
+
+    def get_trades_since(self, market: str, cursor: int = 0) -> Tuple[List[TradeRecord], int]:
+        """Return the trades received since the cursor and the cursor to pass to the next call"""
+        self._subscribe_to_trades(market)
+        if market not in self._trades:
+            return [], cursor
+        return self._trades[market].get_since(cursor)
 
     def get_orderbook(self, market: str) -> Dict[str, List[Tuple[float, float]]]:
         subscription = {'channel': 'orderbook', 'market': market}
@@ -111,11 +158,15 @@ class FtxWebsocketClient(WebsocketManager):
             self._subscribe(subscription)
         self._orderbook_update_events[market].wait(timeout)
 
-    def get_ticker(self, market: str) -> Dict:
+    def get_ticker_record(self, market: str) -> Optional[TickerRecord]:
         subscription = {'channel': 'ticker', 'market': market}
         if subscription not in self._subscriptions:
             self._subscribe(subscription)
-        return self._tickers[market]
+        return self._tickers.get(market)
+
+    def get_ticker(self, market: str) -> Dict:
+        ticker = self.get_ticker_record(market)
+        return ticker.to_dict() if ticker is not None else {}
 
     def _handle_orderbook_message(self, message: Dict) -> None:
         market = message['market']
@@ -151,13 +202,15 @@ class FtxWebsocketClient(WebsocketManager):
             self._orderbook_update_events[market].clear()
 
     def _handle_trades_message(self, message: Dict) -> None:
-        self._trades[message['market']].append(message['data'])
+        trades = self._get_trades_buffer(message['market'])
+        for trade in message['data']:
+            trades.append(TradeRecord.from_message(trade))
 
     def _handle_ticker_message(self, message: Dict) -> None:
-        self._tickers[message['market']] = message['data']
+        self._tickers[message['market']] = TickerRecord.from_message(message['data'])
 
     def _handle_fills_message(self, message: Dict) -> None:
-        self._fills.append(message['data'])
+        self._fills.append(FillRecord.from_message(message['data']))
 
     def _handle_orders_message(self, message: Dict) -> None:
         data = message['data']
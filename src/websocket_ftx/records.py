@@ -0,0 +1,138 @@
+from collections import deque
+from itertools import islice
+from threading import Lock
+from typing import Deque, Dict, Generic, List, Optional, Tuple, TypeVar
+
+
+class TickerRecord:
+    __slots__ = ('bid', 'ask', 'bid_size', 'ask_size', 'last', 'time')
+
+    def __init__(self, bid: Optional[float], ask: Optional[float], bid_size: Optional[float],
+                 ask_size: Optional[float], last: Optional[float], time: float) -> None:
+        self.bid = bid
+        self.ask = ask
+        self.bid_size = bid_size
+        self.ask_size = ask_size
+        self.last = last
+        self.time = time
+
+    @classmethod
+    def from_message(cls, data: Dict) -> 'TickerRecord':
+        return cls(data.get('bid'), data.get('ask'), data.get('bidSize'), data.get('askSize'),
+                   data.get('last'), data.get('time'))
+
+    def to_dict(self) -> Dict:
+        # Same keys and key order as the ticker channel messages
+        return {'bid': self.bid, 'ask': self.ask, 'bidSize': self.bid_size,
+                'askSize': self.ask_size, 'last': self.last, 'time': self.time}
+
+
+class TradeRecord:
+    __slots__ = ('id', 'price', 'size', 'side', 'liquidation', 'time')
+
+    def __init__(self, id: int, price: float, size: float, side: str, liquidation: bool,
+                 time: str) -> None:
+        self.id = id
+        self.price = price
+        self.size = size
+        self.side = side
+        self.liquidation = liquidation
+        self.time = time
+
+    @classmethod
+    def from_message(cls, data: Dict) -> 'TradeRecord':
+        return cls(data.get('id'), data.get('price'), data.get('size'), data.get('side'),
+                   data.get('liquidation'), data.get('time'))
+
+    def to_dict(self) -> Dict:
+        return {'id': self.id, 'price': self.price, 'size': self.size, 'side': self.side,
+                'liquidation': self.liquidation, 'time': self.time}
+
+
+class FillRecord:
+    __slots__ = ('id', 'market', 'future', 'order_id', 'trade_id', 'side', 'price', 'size', 'fee',
+                 'fee_rate', 'liquidity', 'type', 'time')
+
+    def __init__(self, id: int, market: str, future: Optional[str], order_id: int, trade_id: int,
+                 side: str, price: float, size: float, fee: float, fee_rate: float,
+                 liquidity: str, type: str, time: str) -> None:
+        self.id = id
+        self.market = market
+        self.future = future
+        self.order_id = order_id
+        self.trade_id = trade_id
+        self.side = side
+        self.price = price
+        self.size = size
+        self.fee = fee
+        self.fee_rate = fee_rate
+        self.liquidity = liquidity
+        self.type = type
+        self.time = time
+
+    @classmethod
+    def from_message(cls, data: Dict) -> 'FillRecord':
+        return cls(data.get('id'), data.get('market'), data.get('future'), data.get('orderId'),
+                   data.get('tradeId'), data.get('side'), data.get('price'), data.get('size'),
+                   data.get('fee'), data.get('feeRate'), data.get('liquidity'), data.get('type'),
+                   data.get('time'))
+
+    def to_dict(self) -> Dict:
+        return {'id': self.id, 'market': self.market, 'future': self.future,
+                'orderId': self.order_id, 'tradeId': self.trade_id, 'side': self.side,
+                'price': self.price, 'size': self.size, 'fee': self.fee, 'feeRate': self.fee_rate,
+                'liquidity': self.liquidity, 'type': self.type, 'time': self.time}
+
+
+RecordT = TypeVar('RecordT')
+
+
+class RecordBuffer(Generic[RecordT]):
+    """
+    Bounded buffer of the most recent records of a channel. Every appended record gets a sequence
+    number, so readers can keep a cursor and only fetch the records appended since their last
+    read instead of copying the whole buffer. Records which fell out of the buffer before being
+    read are lost to that reader. The websocket thread appends while other threads read, so the
+    records and the cursor are only accessed under a lock.
+    """
+    __slots__ = ('_records', '_cursor', '_lock')
+
+    def __init__(self, maxlen: int) -> None:
+        self._records: Deque[RecordT] = deque([], maxlen=maxlen)
+        self._cursor = 0
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    @property
+    def maxlen(self) -> int:
+        return self._records.maxlen
+
+    @property
+    def cursor(self) -> int:
+        return self._cursor
+
+    def set_maxlen(self, maxlen: int) -> None:
+        with self._lock:
+            self._records = deque(self._records, maxlen=maxlen)
+
+    def append(self, record: RecordT) -> None:
+        with self._lock:
+            self._records.append(record)
+            self._cursor += 1
+
+    def get_all(self) -> List[RecordT]:
+        with self._lock:
+            return list(self._records)
+
+    def get_since(self, cursor: int) -> Tuple[List[RecordT], int]:
+        with self._lock:
+            current_cursor = self._cursor
+            number_of_new_records = min(current_cursor - cursor, len(self._records))
+            if number_of_new_records <= 0:
+                return [], current_cursor
+            # Walk from the newest record so the cost only depends on the number of new records
+            new_records = list(islice(reversed(self._records), number_of_new_records))
+        new_records.reverse()
+        return new_records, current_cursor